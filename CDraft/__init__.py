@@ -3,6 +3,10 @@
 """ translation setup """
 
 __VERSION__ = '0.4.2'
+# startup is measured from here
+import time
+STARTED = time.time()
+
 import locale
 try :
     locale.setlocale(locale.LC_ALL, '')
@@ -10,7 +14,6 @@ except :
     locale.setlocale(locale.LC_ALL, 'C')
 
 import gettext
-import gtk
 
 import os
 from os.path import pardir, abspath, dirname, join
@@ -22,37 +22,87 @@
 
 """
 provide autosave functions
+
+The main loop only takes a snapshot of the text of changed buffers, the
+writer thread writes them and reports back through gobject.idle_add.
 """
 import gobject
 from cdraft_error import CDraftError
+import math
 import os
-from globals import config
+import time
+from globals import settings
+from instrumentation import LatencyHistogram
+from utils import atomic_write
+import writer
+
+# the timer is armed when a buffer changes, and when it fires while the
+# user is typing the write waits for a pause this long, in seconds
+TYPING_PAUSE = 2
+
+main_loop_latency = LatencyHistogram('autosave main loop time')
 
 def start_autosave(edit_instance):
-    """start the autosave timer"""
-    timeout_id = gobject.timeout_add(1000, autosave_timeout, edit_instance)
-    edit_instance.autosave_timeout_id = timeout_id
-    edit_instance.autosave_elapsed = 0
+    """set up autosave, the timer is only armed once a buffer changes"""
+    edit_instance.autosave_timeout_id = None
+    edit_instance.autosave_last_change = 0
+    # start over whenever the autosave preferences change
+    for option in ('autosave', 'autosavetime'):
+        settings.subscribe('editor', option,
+                           lambda value: reschedule_autosave(edit_instance))
 
 def stop_autosave(edit_instance):
     """stop the autosave timer and remove backup files"""
+    cancel_autosave(edit_instance)
+    # let pending writes finish, they would bring the files back
+    writer.wait()
     for buf in edit_instance.buffers:
         autosave_fn = get_autosave_filename(buf.filename)
         if not buf.filename == edit_instance.UNNAMED_FILENAME and \
            os.path.isfile(autosave_fn):
             os.remove(autosave_fn)
-    gobject.source_remove(edit_instance.autosave_timeout_id)
+
+def buffer_changed(edit_instance):
+    """a buffer changed, make sure an autosave is coming"""
+    edit_instance.autosave_last_change = time.time()
+    if edit_instance.autosave_timeout_id is None:
+        schedule_autosave(edit_instance)
+
+def schedule_autosave(edit_instance, delay=None):
+    """arm the one-shot autosave timer, by default for autosavetime"""
+    cancel_autosave(edit_instance)
+    if not settings.editor.autosave:
+        return
+    if delay is None:
+        delay = settings.editor.autosavetime * 60
+    edit_instance.autosave_timeout_id = gobject.timeout_add_seconds(
+        delay, autosave_timeout, edit_instance
+    )
+
+def cancel_autosave(edit_instance):
+    """disarm the autosave timer"""
+    if edit_instance.autosave_timeout_id is not None:
+        gobject.source_remove(edit_instance.autosave_timeout_id)
+        edit_instance.autosave_timeout_id = None
+
+def reschedule_autosave(edit_instance):
+    """the autosave preferences changed, start over with them"""
+    for buf in edit_instance.buffers:
+        if buf.autosave_dirty:
+            schedule_autosave(edit_instance)
+            return
+    cancel_autosave(edit_instance)
 
 def autosave_timeout(edit_instance):
-    """see if we have to autosave open files"""
-    if config.getint('editor', 'autosave'):
-        if edit_instance.autosave_elapsed >= \
-           config.getint('editor', 'autosavetime') * 60:
-            autosave(edit_instance)
-            edit_instance.autosave_elapsed = 0
-        else:
-            edit_instance.autosave_elapsed += 1
-    return True
+    """autosave open files, unless the user is still typing"""
+    edit_instance.autosave_timeout_id = None
+    typing = time.time() - edit_instance.autosave_last_change
+    if typing < TYPING_PAUSE:
+        schedule_autosave(edit_instance,
+                          int(math.ceil(TYPING_PAUSE - typing)))
+    else:
+        main_loop_latency.time(autosave, edit_instance)
+    return False
 
 def get_autosave_filename(filename):
     """get the filename autosave would happen to"""
@@ -64,20 +114,26 @@ def get_autosave_filename(filename):
     return autosave_filename
 
 def autosave(edit_instance):
-    """save all open files that have been saved before"""
+    """save the open files that have been saved before
+
+    only buffers changed since their last autosave are written"""
     for buf in edit_instance.buffers:
-        if not buf.filename == edit_instance.UNNAMED_FILENAME:
-            backup_file = open(
-                get_autosave_filename(buf.filename),
-                'w'
-            )
-            try:
-                try:
-                    backup_file.write(
-                        buf.get_text(buf.get_start_iter(), buf.get_end_iter())
-                    )
-                except IOError:
-                    raise CDraftError(_("Could not autosave file %s") % 
-                                        buf.filename)
-            finally:
-                backup_file.close()
+        if buf.autosave_dirty and buf.loader is None and \
+           not buf.filename == edit_instance.UNNAMED_FILENAME:
+            snapshot = buf.get_text(buf.get_start_iter(), buf.get_end_iter())
+            buf.autosave_dirty = False
+            writer.queue_job(write_backup, edit_instance, buf, buf.filename,
+                             snapshot)
+
+def write_backup(edit_instance, buf, filename, snapshot):
+    """write the snapshot of buf, runs in the worker thread"""
+    try:
+        atomic_write(get_autosave_filename(filename), snapshot)
+    except (IOError, OSError):
+        gobject.idle_add(autosave_failed, edit_instance, buf, filename)
+
+def autosave_failed(edit_instance, buf, filename):
+    """report a failed autosave, it is tried again next time"""
+    buf.autosave_dirty = True
+    schedule_autosave(edit_instance)
+    raise CDraftError(_("Could not autosave file %s") % filename)
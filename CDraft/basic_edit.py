@@ -23,16 +23,30 @@
 This file provides all basic editor functionality.
 """
 
+import gobject
 import gtk
 import os
 import urllib
 import pango
+from collections import deque
+from multiprocessing.pool import ThreadPool
 
 from cdraft_error import CDraftError
+from piece_table import to_unicode
+from revision_tree import Text
+import journal
+from journal import Journal
+from word_index import WordIndex
+from loader import StreamingLoader, read_chunks, prefetch
+from mapped_file import MappedFile
+from paragraphs import ParagraphCounter
 from gui import GUI
 from preferences import Preferences
 import autosave
-from globals import state, config
+import writer
+from globals import state, config, settings
+from instrumentation import RateCounter
+from utils import atomic_write
 
 FILE_UNNAMED = _('* Unnamed *')
 
@@ -109,10 +123,11 @@ def make_accel_group(edit_instance):
     keybindings = {
             'i': edit_instance.show_info,
             's': edit_instance.commit,
-            'z': edit_instance.revert,
+            'z': edit_instance.undo,
+            'y': edit_instance.redo,
             'n': edit_instance.new_buffer,
             'o': edit_instance.open_file,
-            'p': edit_instance.preferences.show,
+            'p': edit_instance.show_preferences,
             'q': edit_instance.dialog_quit,
             'w': edit_instance.close_dialog,
             'l': edit_instance.go_next,
@@ -161,8 +176,16 @@ def define_keybindings(edit_instance):
         translated_bindings[hardware_keycode] = value
     return translated_bindings
 
+# rough per record bookkeeping cost, counted against the undo budget
+UNDO_RECORD_SIZE = 64
+
+# worker threads reading files opened from the command line
+OPEN_THREADS = 4
+
 class UndoableInsert(object):
     """something that has been inserted into our textbuffer"""
+    __slots__ = ('offset', 'text', 'length', 'mergeable')
+
     def __init__(self, text_iter, text, length):
         self.offset = text_iter.get_offset()
         self.text = text
@@ -172,8 +195,36 @@ class UndoableInsert(object):
         else:
             self.mergeable = True
 
+    def merge(self, other):
+        """swallow other if it continues our typing, returns success"""
+        if not isinstance(other, UndoableInsert) or \
+           not (self.mergeable and other.mergeable) or \
+           other.offset != self.offset + self.length:
+            return False
+        self.text += other.text
+        self.length += other.length
+        return True
+
+    def undo(self, text_buffer):
+        start = text_buffer.get_iter_at_offset(self.offset)
+        text_buffer.delete(start,
+                text_buffer.get_iter_at_offset(self.offset + self.length))
+        text_buffer.place_cursor(text_buffer.get_iter_at_offset(self.offset))
+
+    def redo(self, text_buffer):
+        text_buffer.insert(text_buffer.get_iter_at_offset(self.offset),
+                           self.text)
+        text_buffer.place_cursor(
+                text_buffer.get_iter_at_offset(self.offset + self.length))
+
+    def size(self):
+        return UNDO_RECORD_SIZE + len(self.text)
+
 class UndoableDelete(object):
     """something that has ben deleted from our textbuffer"""
+    __slots__ = ('deleted_text', 'start', 'end', 'delete_key_used',
+                 'mergeable')
+
     def __init__(self, text_buffer, start_iter, end_iter):
         self.deleted_text = text_buffer.get_text(start_iter, end_iter)
         self.start = start_iter.get_offset()
@@ -190,106 +241,38 @@ class UndoableDelete(object):
         else:
             self.mergeable = True
 
-class TextSelection:
-    def __init__(self, text="", bookmark_start = None, parent = None):
-        self.current = 0
-        self.selection = 0
-        self.text = [[SimpleText(text, bookmark_start, self)]]
-        self.terminal = ""
-        self.start_pos = bookmark_start.get_offset()
-
-    def get_text(self):
-        text = ""
-        for subtext in self.text[self.selection]:
-            text += subtext.get_text()
-        return text
-
-    def get_current(self, offset):
-        if start_pos <= offset and offset < offset + len(self.text):
-            for text in self.text[self.selection]:
-                current = text.get_current(offset)
-                if current == False:
-                    continue
-                else:
-                    self.current = self.text[self.selection].index(current)
-                    return current
+    def merge(self, other):
+        """swallow other if it continues our deleting, returns success"""
+        if not isinstance(other, UndoableDelete) or \
+           not (self.mergeable and other.mergeable) or \
+           self.delete_key_used != other.delete_key_used:
+            return False
+        if self.delete_key_used and other.start == self.start:
+            self.deleted_text += other.deleted_text
+            self.end += other.end - other.start
+        elif not self.delete_key_used and other.end == self.start:
+            self.deleted_text = other.deleted_text + self.deleted_text
+            self.start = other.start
         else:
-            return False;
-
-    def shift_by(self, length):
-        for i in range(self.current + 1, len(self.text[self.selection])):
-            if self.text[self.selection][i] != None:
-                self.text[self.selection][i].shift_by(length)
-
-    def insert_text(self, inserted_text, insert_position):
-        self.text[self.selection][self.current].insert_text(inserted_text, insert_position)
-        if self.parent != None:
-            self.parent.shift_by(len(inserted_text))
-
-    def delete_text(self, start_offset, end_offset):
-        self.text[self.selection][self.current].delete_text(start_offset, end_offset)
-        if self.parent != None:
-            self.parent.shift_by(start_offset - end_offset)
-
-
-
-class SimpleText:
-    def __init__(self, text="", bookmark_start = None, parent = None):
-        self.text = text
-        self.start_pos = bookmark_start.get_offset()
-        self.parent = parent
-
-    def get_text(self):
-        return self.text
-
-    def shift_by(self, length):
-        self.start_pos += length
-
-    def get_current(self, offset):
-        if self.start_pos <= offset and offset <= self.start_pos + len(self.text):
-            return self;
+            return False
+        return True
+
+    def undo(self, text_buffer):
+        text_buffer.insert(text_buffer.get_iter_at_offset(self.start),
+                           self.deleted_text)
+        if self.delete_key_used:
+            cursor = self.start
         else:
-            return False;
-
-    def insert_text(self, inserted_text, insert_position):
-        self.text = self.text[0:(insert_position - self.start_pos)] + inserted_text + self.text[(insert_position - self.start_pos):len(self.text)]
-        if self.parent != None:
-            self.parent.shift_by(len(inserted_text))
+            cursor = self.end
+        text_buffer.place_cursor(text_buffer.get_iter_at_offset(cursor))
 
-    def delete_text(self, start_offset, end_offset):
-        self.text = self.text[0:(start_offset - self.start_pos)] + self.text[(end_offset - self.start_pos):len(self.text)]
-        if self.parent != None:
-            self.parent.shift_by(start_offset - end_offset)
+    def redo(self, text_buffer):
+        start = text_buffer.get_iter_at_offset(self.start)
+        text_buffer.delete(start, text_buffer.get_iter_at_offset(self.end))
+        text_buffer.place_cursor(text_buffer.get_iter_at_offset(self.start))
 
-
-class Text:
-    def __init__(self, text="", bookmark_start = None):
-        self.current = 0
-        self.text = [SimpleText(text, bookmark_start, self)]
-        self.bookmark_start = bookmark_start.get_offset()
-
-    def get_text(self):
-        text = ""
-        for subtext in self.text:
-            text += subtext.get_text()
-        return text
-
-    def push(self, text):
-        self.text.append(text)
-
-    def get_current(self, offset):
-        for text in self.text:
-            current = text.get_current(offset)
-            if current == False:
-                continue
-            else:
-                self.current = self.text.index(current)
-                return current
-
-    def shift_by(self, length):
-        for i in range(self.current + 1, len(self.text)):
-            if self.text[i] != None:
-                self.text[i].shift_by(length)
+    def size(self):
+        return UNDO_RECORD_SIZE + len(self.deleted_text)
 
 class UndoableBuffer(gtk.TextBuffer):
     """text buffer with added undo capabilities
@@ -303,29 +286,63 @@ class UndoableBuffer(gtk.TextBuffer):
         """
         gtk.TextBuffer.__init__(self)
         self.modified = False
-        self.text = Text("", self.get_iter_at_mark(self.get_mark("insert")))
+        # changed since the last autosave
+        self.autosave_dirty = False
+        # StreamingLoader filling the buffer, if any
+        self.loader = None
+        # the user changed the buffer while it was being loaded
+        self.edited_while_loading = False
+        # error of a failed save not reported yet, set by the writer
+        self.save_error = None
+        # close the buffer once it has been saved
+        self.close_when_saved = False
+        self.read_only = False
+        # groups of records, oldest first; typing a word ends up as one
+        # merged record, everything done in one user action in one group
+        self.undo_stack = deque()
+        self.redo_stack = []
+        self.undo_size = 0
+        self.undo_budget = settings.editor.undobudget
+        self.undo_in_progress = False
+        self.not_undoable_action = 0
+        self.group_open = False
+        self.text = Text("", self.get_iter_at_mark(self.get_mark("insert")).get_offset())
+        self.journal = Journal()
+        self.words = WordIndex()
+        self.paragraphs = ParagraphCounter(self)
         self.command = False
-        #self.connect('changed', self.on_changed)
-        self.connect('delete-range', self.on_delete_range)
+        self.connect('changed', self.on_changed)
+        self.delete_range_id = self.connect('delete-range',
+                                            self.on_delete_range)
         self.connect('begin_user_action', self.on_begin_user_action)
-        self.connect('insert-text', self.on_insert_text)
+        self.insert_text_id = self.connect('insert-text', self.on_insert_text)
         self.i_tag = self.create_tag( "i", background="#DDDDDD")
         self.j_tag = self.create_tag( "j", background="#EEEEEE")
 
+    def on_changed(self, text_buffer):
+        self.modified = True
+        self.autosave_dirty = True
+
     def on_insert_text(self, textbuffer, pos_iter, inserted_text, inserted_length):
-        current = self.text.get_current(pos_iter.get_offset())
-        current.insert_text(inserted_text, pos_iter.get_offset());
-        #print self.text.get_text()
+        inserted_text = to_unicode(inserted_text)
+        if self.recording():
+            self.record(UndoableInsert(pos_iter, inserted_text,
+                                       len(inserted_text)))
+        self.text.insert_text(inserted_text, pos_iter.get_offset())
+        if self.loader is None:
+            # the journal starts over once the file is loaded
+            self.journal.insert(pos_iter.get_offset(), inserted_text)
+        self.words.insert(pos_iter.get_offset(), inserted_text)
 
     def on_delete_range(self, text_buffer, start_iter, end_iter):
-        current = self.text.get_current(start_iter.get_offset())
-        current.delete_text(start_iter.get_offset(), end_iter.get_offset());
-        #print self.text.get_text()
-    
-    def update_text(self):
-        self.set_text(self.text.get_text())
-        #self.move_mark_by_name("insert", self.get_iter_at_offset(self.curr.bookmark_start - 1))
-        #self.move_mark_by_name("selection_bound", self.get_iter_at_offset(self.curr.bookmark_end))
+        # the record copies the deleted text, only build it if it is kept
+        if self.recording():
+            self.record(UndoableDelete(self, start_iter, end_iter))
+        start, end = start_iter.get_offset(), end_iter.get_offset()
+        self.text.delete_text(start, end)
+        if self.loader is None:
+            self.journal.delete(start, end)
+        self.words.delete(start, end)
 
     def highlight_selection(self):
         self.apply_tag(self.i_tag, self.get_iter_at_mark(self.get_mark("insert")), self.get_iter_at_mark(self.get_mark("selection_bound")))
@@ -333,54 +350,97 @@ class UndoableBuffer(gtk.TextBuffer):
         self.apply_tag(self.j_tag, self.get_iter_at_mark(self.get_mark("insert")), self.get_iter_at_mark(self.get_mark("selection_bound")))
 
     def commit_text(self):
-        self.curr.committed = True
+        self.journal.commit()
 
-    def revert_to_parent(self):
-        if not self.curr.parent is None:
-            self.curr = self.curr.parent
-            self.set_text(self.curr.text)
-            self.place_cursor(self.get_iter_at_offset(self.curr.bookmark_end))
+    def recording(self):
+        """whether changes go on the undo stack right now"""
+        return not (self.undo_in_progress or self.not_undoable_action)
 
-    def revise(self):
-        cursor_position = self.get_iter_at_mark(self.get_mark("insert")).get_offset()
-        text = self.text.get_text()
-
-        def get_word(text, pos, end):
-            if pos == end:
-                j = pos
-                i = pos
-                while i > 0 and text[i - 1] == ' ':
-                    i -= 1
-                while i > 0 and text[i - 1] != ' ':
-                    i -= 1
-            else:
-                if text[pos] != ' ':
-                    i = pos
-                    while i > 0 and text[i - 1] != ' ':
-                        i -= 1
-                    j = pos
-                    while j < end and text[j] != ' ':
-                        j += 1
-                else:
-                    j = pos
-                    i = pos
-                    while i > 0 and text[i - 1] == ' ':
-                        i -= 1
-                    while i > 0 and text[i - 1] != ' ':
-                        i -= 1
-            return [i,j]
-
-        print str(text)
-        print str(cursor_position)
-        print str(len(text))
-        i, j = get_word(text, cursor_position, len(text))
-        print "FFFFFF"
-        temp = text[i:j]
-        self.text.get_current(cursor_position).delete_text(i, j)
-        self.text.push(TextSelection(temp, self.get_iter_at_mark(self.get_mark("insert")), self.text))
-        self.update_text()
+    def record(self, action):
+        """put an insert or delete on the undo stack
 
+        callers check recording() first, before building the action"""
+        self.redo_stack = []
+        if self.group_open:
+            self.undo_stack[-1].append(action)
+            self.undo_size += action.size()
+        else:
+            last = self.undo_stack[-1][-1] if self.undo_stack else None
+            last_size = last.size() if last is not None else 0
+            if last is not None and last.merge(action):
+                self.undo_size += last.size() - last_size
+            else:
+                self.undo_stack.append([action])
+                self.undo_size += action.size()
+            self.group_open = True
+        # forget the oldest groups once we are over budget
+        while self.undo_size > self.undo_budget and len(self.undo_stack) > 1:
+            for old_action in self.undo_stack.popleft():
+                self.undo_size -= old_action.size()
+
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def undo(self):
+        """undo the last group of changes"""
+        if not self.undo_stack:
+            return
+        group = self.undo_stack.pop()
+        for action in group:
+            self.undo_size -= action.size()
+        self.undo_in_progress = True
+        try:
+            for action in reversed(group):
+                action.undo(self)
+        finally:
+            self.undo_in_progress = False
+        self.redo_stack.append(group)
+        self.group_open = False
+
+    def redo(self):
+        """redo the last undone group of changes"""
+        if not self.redo_stack:
+            return
+        group = self.redo_stack.pop()
+        self.undo_in_progress = True
+        try:
+            for action in group:
+                action.redo(self)
+        finally:
+            self.undo_in_progress = False
+        self.undo_stack.append(group)
+        for action in group:
+            self.undo_size += action.size()
+        self.group_open = False
+
+    def begin_not_undoable_action(self):
+        """don't record the following changes"""
+        self.not_undoable_action += 1
+
+    def end_not_undoable_action(self):
+        """record changes again, the history before is dropped"""
+        self.not_undoable_action -= 1
+        if not self.not_undoable_action:
+            self.undo_stack.clear()
+            self.redo_stack = []
+            self.undo_size = 0
+            self.group_open = False
 
+    def revise(self):
+        """turn the word under the cursor into a new revision"""
+        if self.read_only:
+            return
+        cursor_position = self.get_iter_at_mark(self.get_mark("insert")).get_offset()
+        i, j = self.words.word_at(cursor_position)
+        if i == j:
+            return
+        # only the segments are split, the text and so the buffer stay
+        # the same
+        self.text.revise(i, j)
+        self.journal.revise(i, j)
 
     def set_the_text(self):
         cursor_position = self.get_iter_at_mark(self.get_mark("insert"))
@@ -396,13 +456,74 @@ class UndoableBuffer(gtk.TextBuffer):
         #    if self.curr.bookmark_end < cursor_position.get_offset():
         #        self.curr.bookmark_end = cursor_position.get_offset()
 
-   # def on_changed(self, textbuffer):
-   #     if not self.command:
-   #         self.set_the_text()
-
 
     def on_begin_user_action(self, *args, **kwargs):
-        pass
+        # a new user action starts a new undo group
+        self.group_open = False
+        if self.loader is not None:
+            self.edited_while_loading = True
+
+    def close(self):
+        """the buffer is being closed"""
+        if self.loader is not None:
+            self.loader.cancel()
+
+class MappedBuffer(UndoableBuffer):
+    """read-only buffer showing a window of the lines of a huge file
+
+    the window follows the cursor, it is moved once the cursor gets
+    close to one of its ends"""
+
+    WINDOW_LINES = 2000
+    MARGIN = 200
+
+    def __init__(self, filename):
+        UndoableBuffer.__init__(self)
+        self.read_only = True
+        self.mapped = MappedFile(filename)
+        self.first_line = 0
+        self.shift_id = None
+        self.show_lines(0)
+        self.connect('mark-set', self.on_mark_set)
+
+    def show_lines(self, first_line):
+        """show the window starting at first_line"""
+        self.first_line = first_line
+        self.begin_not_undoable_action()
+        self.set_text(self.mapped.lines(first_line, self.WINDOW_LINES))
+        self.end_not_undoable_action()
+        self.modified = self.autosave_dirty = False
+        self.journal = Journal()
+
+    def on_mark_set(self, text_buffer, location, mark):
+        if mark != self.get_insert() or self.shift_id is not None:
+            return
+        line = location.get_line()
+        if (line < self.MARGIN and self.first_line > 0) or \
+           (line >= self.WINDOW_LINES - self.MARGIN and
+            self.mapped.line_start(self.first_line + self.WINDOW_LINES)
+            is not None):
+            self.shift_id = gobject.idle_add(self.shift_window)
+
+    def shift_window(self):
+        """center the window on the cursor"""
+        self.shift_id = None
+        cursor = self.get_iter_at_mark(self.get_insert())
+        line = self.first_line + cursor.get_line()
+        column = cursor.get_line_offset()
+        self.show_lines(max(0, line - self.WINDOW_LINES // 2))
+        cursor = self.get_iter_at_line(line - self.first_line)
+        cursor.set_line_offset(min(column, cursor.get_chars_in_line()))
+        self.place_cursor(cursor)
+        textbox = state['gui'].textbox
+        if textbox.get_buffer() is self:
+            textbox.scroll_to_mark(self.get_insert(), 0.0, True, 0.0, 0.5)
+        return False
+
+    def close(self):
+        if self.shift_id is not None:
+            gobject.source_remove(self.shift_id)
+        self.mapped.close()
 
 class BasicEdit(object):
     """editing logic that gets passed around"""
@@ -413,7 +534,9 @@ class BasicEdit(object):
         self.config = config
         gui = GUI()
         state['gui'] = gui
-        self.preferences = Preferences()
+        # built on first use
+        self._preferences = None
+        self._dialog = self._quitdialog = None
         try:
             self.recent_manager = gtk.recent_manager_get_default()
         except AttributeError:
@@ -425,12 +548,15 @@ class BasicEdit(object):
         self.textbox = gui.textbox
         self.UNNAMED_FILENAME = FILE_UNNAMED
 
-        self.autosave_timeout_id = ''
-        self.autosave_elapsed = ''
+        # the revision status is refreshed once the pending events are
+        # handled, and only if it changed
+        self.revision_info = None
+        self.revision_info_id = None
+        self.revision_info_updates = RateCounter('revision status updates')
 
         self.textbox.connect('key-press-event', self.key_press_event)
 
-        # Autosave timer object
+        # Autosave is scheduled when buffers change
         autosave.start_autosave(self)
 
         self.window.show_all()
@@ -444,14 +570,29 @@ class BasicEdit(object):
         monitor_geometry = screen.get_monitor_geometry(current_monitor_number)
         self.window.move(monitor_geometry.x, monitor_geometry.y)
 
-        # Defines the glade file functions for use on closing a buffer or exit
+        self.keybindings = define_keybindings(self)
+        # the only time the theme is applied on startup, the widgets
+        # have to be shown for it to stick
+        gui.apply_theme()
+
+    @property
+    def preferences(self):
+        if self._preferences is None:
+            self._preferences = Preferences()
+        return self._preferences
+
+    def show_preferences(self):
+        self.preferences.show()
+
+    def build_dialogs(self):
+        """build the dialogs for closing a buffer or exit from glade"""
         gladefile = os.path.join(state['absolute_path'], "interface.glade")
         builder = gtk.Builder()
         builder.add_from_file(gladefile)
-        self.dialog = builder.get_object("SaveBuffer")
-        self.dialog.set_transient_for(self.window)
-        self.quitdialog = builder.get_object("QuitSave")
-        self.quitdialog.set_transient_for(self.window)
+        self._dialog = builder.get_object("SaveBuffer")
+        self._dialog.set_transient_for(self.window)
+        self._quitdialog = builder.get_object("QuitSave")
+        self._quitdialog.set_transient_for(self.window)
         dic = {
                 "on_button-close_clicked": self.unsave_dialog,
                 "on_button-cancel_clicked": self.cancel_dialog,
@@ -462,15 +603,20 @@ class BasicEdit(object):
                 }
         builder.connect_signals(dic)
 
-        self.keybindings = define_keybindings(self)
-        # this sucks, shouldn't have to call this here, textbox should
-        # have its background and padding color from GUI().__init__() already
-        gui.apply_theme()
+    @property
+    def dialog(self):
+        if self._dialog is None:
+            self.build_dialogs()
+        return self._dialog
+
+    @property
+    def quitdialog(self):
+        if self._quitdialog is None:
+            self.build_dialogs()
+        return self._quitdialog
 
     def key_press_event(self, widget, event):
         """ key press event dispatcher """
-        self.show_revision_info()
-        #self.revision_status.set_text(str(self.buffers[self.current].revise()))
         if event.state & gtk.gdk.CONTROL_MASK:
             if event.hardware_keycode in self.keybindings:
                 self.keybindings[event.hardware_keycode]()
@@ -484,14 +630,20 @@ class BasicEdit(object):
         buf = self.buffers[self.current]
         buf.highlight_selection2()
 
+    def queue_revision_info(self):
+        """refresh the revision status when idle, changes coalesce"""
+        if self.revision_info_id is None:
+            self.revision_info_id = gobject.idle_add(self.show_revision_info)
+
     def show_revision_info(self):
-        #buf = self.buffers[self.current]
-        #if buf.curr.committed:
-        #    part = "(+) "
-        #else:
-        #    part = "( ) "
-        #self.revision_status.set_text(part + str(buf.curr.depth) + " - " + str(len(buf.curr.branches)))
-        self.revision_status.set_text("Revisions: 2")
+        self.revision_info_id = None
+        buf = self.buffers[self.current]
+        info = _('Revisions: %d') % buf.text.revisions
+        if info != self.revision_info:
+            self.revision_info = info
+            self.revision_status.set_text(info)
+            self.revision_info_updates.tick()
+        return False
 
     def show_info(self):
         """ Display buffer information on status label for 5 seconds """
@@ -503,13 +655,14 @@ class BasicEdit(object):
             status = ''
         self.status.set_text(_('Buffer %(buffer_id)d: %(buffer_name)s\
                 %(status)s, %(char_count)d character(s), %(word_count)d word(s)\
-                , %(lines)d line(s)') % {
+                , %(lines)d line(s), %(paragraphs)d paragraph(s)') % {
                     'buffer_id': self.current + 1,
-                    'buffer_name': buf.filename if int(config.get('visual', 'showpath')) else os.path.split(buf.filename)[1],
+                    'buffer_name': buf.filename if settings.visual.showpath else os.path.split(buf.filename)[1],
                     'status': status,
                     'char_count': buf.get_char_count(),
                     'word_count': self.word_count(buf),
                     'lines': buf.get_line_count(),
+                    'paragraphs': buf.paragraphs.paragraphs,
                     }, 5000)
 
     def go_next(self):
@@ -519,9 +672,10 @@ class BasicEdit(object):
         buf.command = False
 
     def revise_word(self):
-        print "ffffff"
+        """ Turn the word under the cursor into a revision """
         buf = self.textbox.get_buffer()
         buf.revise()
+        self.queue_revision_info()
 
     def go_prev(self):
         buf = self.textbox.get_buffer()
@@ -535,11 +689,23 @@ class BasicEdit(object):
         buf.go_down()
         buf.command = False
 
-    def revert(self):
+    def undo(self):
+        """ Undo last typing """
         buf = self.textbox.get_buffer()
-        buf.command = True
-        buf.revert_to_parent()
-        buf.command = False
+        if buf.can_undo():
+            buf.undo()
+            self.queue_revision_info()
+        else:
+            self.status.set_text(_('No more undo!'))
+
+    def redo(self):
+        """ Redo last typing """
+        buf = self.textbox.get_buffer()
+        if buf.can_redo():
+            buf.redo()
+            self.queue_revision_info()
+        else:
+            self.status.set_text(_('No more redo!'))
 
     def commit(self):
         buf = self.textbox.get_buffer()
@@ -609,33 +775,100 @@ Open those instead of the original file?''')
             self.status.set_text(_('Closed, no files selected'))
         chooser.destroy()
 
-    def open_file_no_chooser(self, filename):
-        """ Open specified file """
-        def check_backup(filename):
-            """check if restore from backup is an option
-
-            returns backup filename if there's a backup file and
-                    user wants to restore from it, else original filename
-            """
-            fname = autosave.get_autosave_filename(filename)
-            if os.path.isfile(fname):
-                if self.ask_restore():
-                    return fname
-                else:
-                    os.remove(fname)
-            return filename
-        buf = self.new_buffer()
+    def check_backup(self, filename):
+        """check if restore from backup is an option
+
+        returns backup filename if there's a backup file and
+                user wants to restore from it, else original filename
+        """
+        fname = autosave.get_autosave_filename(filename)
+        if os.path.isfile(fname):
+            if self.ask_restore():
+                return fname
+            else:
+                os.remove(fname)
+        return filename
+
+    def too_large(self, filename):
+        """whether filename is only opened read-only"""
+        try:
+            return os.path.getsize(filename) > \
+                   settings.editor.readonlysize
+        except OSError:
+            # not there or not readable, opening it reports that
+            return False
+
+    def open_mapped_file(self, filename, switch=True):
+        """ Open a file too large to edit read-only """
+        buf = self.new_buffer(MappedBuffer(filename), switch)
+        buf.filename = filename
+        self.status.set_text(
+            _('File %s is too large to edit, opened read-only') % filename
+        )
+
+    def open_file_no_chooser(self, filename, prefetched=None):
+        """ Open specified file
+
+        prefetched is (buf, filename_to_open, size, chunks, error) for a
+        file read ahead by open_files_in_background into the buffer it
+        added for it"""
+        if prefetched is None and self.too_large(filename):
+            self.open_mapped_file(filename)
+            return
+        if prefetched is None:
+            buf = self.new_buffer()
+            filename_to_open = self.check_backup(filename)
+        else:
+            buf, filename_to_open, size, chunks, error = prefetched
+            if buf not in self.buffers:
+                # closed while it was being read
+                return
+            buf.read_only = False
+            if buf is self.buffers[self.current]:
+                self.textbox.set_editable(True)
         buf.filename = filename
-        filename_to_open = check_backup(filename)
+
+        def progress(fraction):
+            self.status.set_text(_('Loading %(filename)s: %(percent)d%%') % {
+                'filename': filename_to_open,
+                'percent': fraction * 100,
+                })
+
+        def done():
+            buf.journal = Journal()
+            if buf.edited_while_loading:
+                # keep what was typed meanwhile modified; it isn't in the
+                # journal, so the next save writes a full snapshot
+                buf.edited_while_loading = False
+                autosave.buffer_changed(self)
+            else:
+                buf.modified = buf.autosave_dirty = False
+                if filename_to_open == filename:
+                    revisions, revisions_journal = journal.load(
+                        filename, buf.text.get_text()
+                    )
+                    if revisions is not None:
+                        buf.text, buf.journal = revisions, revisions_journal
+            self.queue_revision_info()
+            self.status.set_text(_('File %s open') % filename_to_open)
+
+        def failed(error):
+            # only part of the file is in the buffer, it must not be
+            # saved over the file; what was typed meanwhile stays modified
+            buf.filename = FILE_UNNAMED
+            buf.modified = buf.autosave_dirty = buf.edited_while_loading
+            buf.edited_while_loading = False
+            buf.journal = Journal()
+            raise CDraftError(_('Unable to open %s\n') % filename_to_open)
 
         try:
-            buffer_file = open(filename_to_open, 'r')
-            buf = self.buffers[self.current]
-            #buf.begin_not_undoable_action()
-            utf8 = unicode(buffer_file.read(), 'utf-8')
-            buf.set_text(utf8)
-            #buf.end_not_undoable_action()
-            buffer_file.close()
+            if prefetched is None:
+                source = open(filename_to_open, 'rb')
+                size = os.fstat(source.fileno()).st_size
+                chunks = read_chunks(source)
+            elif error is not None:
+                raise error
+            StreamingLoader(buf, chunks, size, progress, done, failed)
         except IOError, (errno, strerror):
             errortext = _('Unable to open %(filename)s.') % {
                     'filename': filename_to_open
@@ -645,53 +878,122 @@ Open those instead of the original file?''')
                         the file.')
                 if not errno == 2:
                     raise CDraftError(errortext)
+        except CDraftError:
+            raise
         except:
             raise CDraftError(_('Unable to open %s\n') % filename_to_open)
-        else:
-            self.status.set_text(_('File %s open') % filename_to_open)
 
-    def save_file(self):
-        """ Save file """
-        try:
+    def open_files_in_background(self, filenames):
+        """open files, reading and decoding them in worker threads
+
+        the buffers are added at the end in the order of filenames right
+        away, each is filled as soon as its file has been read"""
+        pool = ThreadPool(min(len(filenames), OPEN_THREADS))
+        for filename in filenames:
+            if self.too_large(filename):
+                # mapping it is cheap already
+                self.open_mapped_file(filename, switch=False)
+                continue
+            filename_to_open = self.check_backup(filename)
+            buf = self.new_buffer(switch=False)
+            buf.filename = filename
+            # nothing to edit until it is filled
+            buf.read_only = True
+            pool.apply_async(
+                prefetch, (filename_to_open,),
+                callback=self.prefetched_callback(buf, filename,
+                                                  filename_to_open)
+            )
+        pool.close()
+
+    def prefetched_callback(self, buf, filename, filename_to_open):
+        """callback for a prefetch, runs in the pool's result thread"""
+        def callback(result):
+            gobject.idle_add(self.open_file_no_chooser, filename,
+                             (buf, filename_to_open) + result)
+        return callback
+
+    def save_file(self, buf=None):
+        """ Save a buffer, the current one by default
+
+        the main loop only takes a snapshot of the text, the writer
+        thread writes it """
+        if buf is None:
             buf = self.buffers[self.current]
-            if buf.filename != FILE_UNNAMED:
-                buffer_file = open(buf.filename, 'w')
-                txt = buf.get_text(buf.get_start_iter(),
-                        buf.get_end_iter())
-                buffer_file.write(txt)
-                if self.recent_manager:
-                    self.recent_manager.add_full(
-                            "file://" + urllib.quote(buf.filename),
-                            {
-                                'mime_type':'text/plain',
-                                'app_name':'cdraft',
-                                'app_exec':'%F',
-                                'is_private':False,
-                                'display_name':os.path.basename(buf.filename),
-                                }
-                            )
-                    buffer_file.close()
-                #buf.begin_not_undoable_action()
-                #buf.end_not_undoable_action()
-                self.status.set_text(_('File %s saved') % buf.filename)
-            else:
-                self.save_file_as()
-                return
-        except IOError, (errno, strerror):
-            errortext = _('Unable to save %(filename)s.') % {
-                    'filename': buf.filename}
-            if errno == 13:
-                errortext += _(' You do not have permission to write to \
-                        the file.')
-                raise CDraftError(errortext)
-        except:
-            raise CDraftError(_('Unable to save %s\n') % buf.filename)
+        if buf.loader is not None:
+            self.status.set_text(_('File %s is still loading') %
+                                 buf.filename)
+            return
+        if buf.read_only:
+            self.status.set_text(_('File %s is opened read-only') %
+                                 buf.filename)
+            return
+        if buf.filename == FILE_UNNAMED:
+            self.save_file_as(buf)
+            return
+        snapshot = buf.get_text(buf.get_start_iter(), buf.get_end_iter())
+        writer.queue_job(self.write_file, buf, buf.filename, snapshot)
         buf.modified = False
+        self.status.set_text(_('Saving %s') % buf.filename)
+        # the revisions as of the same snapshot
+        buf.journal.save(buf.filename, buf.text,
+                         self.revisions_failed_callback(buf.filename))
 
-    def save_file_as(self):
-        """ Save file as """
-
-        buf = self.buffers[self.current]
+    def write_file(self, buf, filename, snapshot):
+        """write a snapshot to filename, runs in the writer thread"""
+        try:
+            atomic_write(filename, snapshot)
+        except (IOError, OSError), error:
+            buf.save_error = error
+            gobject.idle_add(self.save_failed, buf, filename, error)
+        else:
+            gobject.idle_add(self.file_saved, buf, filename)
+
+    def revisions_failed_callback(self, filename):
+        """callback for failed revision writes, runs in the writer thread"""
+        def callback(error):
+            gobject.idle_add(self.revisions_failed, filename)
+        return callback
+
+    def revisions_failed(self, filename):
+        raise CDraftError(_('Unable to save the revisions of %s\n') %
+                          filename)
+
+    def file_saved(self, buf, filename):
+        if buf.close_when_saved:
+            buf.close_when_saved = False
+            # unless it was changed again in the meantime
+            if not buf.modified and buf in self.buffers:
+                self.close_buffer(buf)
+        if self.recent_manager:
+            self.recent_manager.add_full(
+                    "file://" + urllib.quote(filename),
+                    {
+                        'mime_type':'text/plain',
+                        'app_name':'cdraft',
+                        'app_exec':'%F',
+                        'is_private':False,
+                        'display_name':os.path.basename(filename),
+                        }
+                    )
+        self.status.set_text(_('File %s saved') % filename)
+
+    def save_failed(self, buf, filename, error):
+        buf.modified = True
+        buf.save_error = None
+        buf.close_when_saved = False
+        errortext = _('Unable to save %(filename)s.') % {
+                'filename': filename}
+        if error.errno == 13:
+            errortext += _(' You do not have permission to write to \
+                    the file.')
+        raise CDraftError(errortext)
+
+    def save_file_as(self, buf=None):
+        """ Save a buffer, the current one by default, under a new name """
+
+        if buf is None:
+            buf = self.buffers[self.current]
         chooser = gtk.FileChooserDialog('PyRoom', self.window,
                 gtk.FILE_CHOOSER_ACTION_SAVE,
                 buttons=(gtk.STOCK_CANCEL, gtk.RESPONSE_CANCEL,
@@ -707,45 +1009,45 @@ Open those instead of the original file?''')
         res = chooser.run()
         if res == gtk.RESPONSE_OK:
             buf.filename = chooser.get_filename()
-            self.save_file()
+            self.save_file(buf)
         else:
             self.status.set_text(_('Closed, no files selected'))
         chooser.destroy()
 
-    #XXX: This can't be the best way to do this.
     def word_count(self, buf):
-        """ Word count in a text buffer """
-
-        iter1 = buf.get_start_iter()
-        iter2 = iter1.copy()
-        iter2.forward_word_end()
-        count = 0
-        while iter2.get_offset() != iter1.get_offset():
-            count += 1
-            iter1 = iter2.copy()
-            iter2.forward_word_end()
-        return count
+        """ Word count in a text buffer, kept up to date by its word index """
+        return buf.words.word_count
 
     def show_help(self):
         """ Create a new buffer and inserts help """
         buf = self.new_buffer()
-        #buf.begin_not_undoable_action()
+        buf.begin_not_undoable_action()
         buf.set_text(HELP)
-        #buf.end_not_undoable_action()
+        buf.end_not_undoable_action()
+        buf.modified = buf.autosave_dirty = False
         self.status.set_text("Displaying help. Press control W to exit and \
                 continue editing your document.")
 
-    def new_buffer(self):
-        """ Create a new buffer """
+    def new_buffer(self, buf=None, switch=True):
+        """ Add a buffer, a new empty one unless one is given
+
+        without switching to it the buffer is added at the end """
 
-        buf = UndoableBuffer()
+        if buf is None:
+            buf = UndoableBuffer()
+        buf.connect('changed', self.buffer_changed)
         buf.filename = FILE_UNNAMED
-        self.buffers.insert(self.current + 1, buf)
         buf.place_cursor(buf.get_end_iter())
+        if not switch:
+            self.buffers.append(buf)
+            return buf
+        self.buffers.insert(self.current + 1, buf)
         self.next_buffer()
-        self.show_revision_info()
         return buf
 
+    def buffer_changed(self, buf):
+        autosave.buffer_changed(self)
+
     def close_dialog(self):
         """ask for confirmation if there are unsaved contents"""
         buf = self.buffers[self.current]
@@ -766,25 +1068,33 @@ Open those instead of the original file?''')
     def save_dialog(self, widget, data=None):
         """save when closing"""
         self.dialog.hide()
-        self.save_file()
-        self.close_buffer()
-
-    def close_buffer(self):
-        """ Close current buffer """
-        autosave_fname = autosave.get_autosave_filename(
-                self.buffers[self.current].filename
-                )
+        buf = self.buffers[self.current]
+        self.save_file(buf)
+        if not buf.modified:
+            # file_saved closes it once it is on disk
+            buf.close_when_saved = True
+
+    def close_buffer(self, buf=None):
+        """ Close a buffer, the current one by default """
+        if buf is None:
+            buf = self.buffers[self.current]
+        autosave_fname = autosave.get_autosave_filename(buf.filename)
         if os.path.isfile(autosave_fname):
             try:
                 os.remove(autosave_fname)
             except OSError:
                 raise CDraftError(_('Could not delete autosave file.'))
+        buf.close()
         if len(self.buffers) > 1:
-            self.buffers.pop(self.current)
+            index = self.buffers.index(buf)
+            self.buffers.pop(index)
+            if index < self.current:
+                self.current -= 1
             self.current = min(len(self.buffers) - 1, self.current)
             self.set_buffer(self.current)
         else:
-            quit()
+            # through our quit, it lets pending saves finish
+            self.quit()
 
     def set_buffer(self, index):
         """ Set current buffer """
@@ -793,6 +1103,8 @@ Open those instead of the original file?''')
             self.current = index
             buf = self.buffers[index]
             self.textbox.set_buffer(buf)
+            self.textbox.set_editable(not buf.read_only)
+            self.queue_revision_info()
             if hasattr(self, 'status'):
                 self.status.set_text(
                         _('Switching to buffer %(buffer_id)d (%(buffer_name)s)')
@@ -845,10 +1157,11 @@ Open those instead of the original file?''')
         self.quitdialog.hide()
         for buf in self.buffers:
             if buf.modified:
-                if buf.filename == FILE_UNNAMED:
-                    self.save_file_as()
-                else:
-                    self.save_file()
+                self.save_file(buf)
+        # a cancelled save as or a file still loading
+        if [buf for buf in self.buffers if buf.modified]:
+            self.status.set_text(_('Not all files were saved'))
+            return
         self.quit()
 
     def quit_quit(self, widget, data=None):
@@ -857,7 +1170,15 @@ Open those instead of the original file?''')
         self.quit()
 
     def quit(self):
-        """cleanup before quitting"""
+        """cleanup before quitting
+
+        saves still being written have to succeed first, or the backups
+        would be removed while the text is nowhere else"""
+        writer.wait()
+        if [buf for buf in self.buffers if buf.save_error is not None]:
+            # save_failed reports them from the main loop
+            self.status.set_text(_('Not all files were saved'))
+            return
         autosave.stop_autosave(self)
         state['gui'].quit()
 
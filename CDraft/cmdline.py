@@ -35,17 +35,22 @@ Based on code posted on ubuntu forums by NoWhereMan (www.nowhereland.it)
 from optparse import OptionParser
 import sys
 
+import gobject
 import gtk
 
 import CDraft
 from basic_edit import BasicEdit
 from cdraft_error import handle_error
 from globals import state
+from instrumentation import report_ready
+import writer
 
 __VERSION__ = CDraft.__VERSION__
 
 def main():
     sys.excepthook = handle_error
+    # autosave and opening files use worker threads
+    gobject.threads_init()
 
     files = []
 
@@ -55,24 +60,31 @@ def main():
                         version = '%prog ' + __VERSION__,
                         description = _('CDraft lets you edit text files \
 simply and efficiently in a full-screen window, with no distractions.'))
+    parser.add_option('--instrument', action='store_true', default=False,
+                      help=_('report performance counters on stderr'))
     (options, args) = parser.parse_args()
     files = args
+    state['instrument'] = options.instrument
 
     # Create relevant buffers for file and load them
     state['edit_instance'] = BasicEdit()
-    buffnum = 0
     if len(files):
-        for filename in files:
-            state['edit_instance'].open_file_no_chooser(filename)
-            buffnum += 1
+        # the first file is interactive right away, the others are read
+        # in the background into buffers kept in command line order
+        state['edit_instance'].open_file_no_chooser(files[0])
+        if len(files) > 1:
+            state['edit_instance'].open_files_in_background(files[1:])
     else:
         state['edit_instance'].new_buffer()
 
-    state['edit_instance'].set_buffer(buffnum)
+    state['edit_instance'].set_buffer(0)
     state['edit_instance'].status.set_text(
         _('Welcome to DeftDraft %s, type Alt-H for help.') % __VERSION__
     )
+    report_ready(state['edit_instance'].textbox, CDraft.STARTED)
     gtk.main()
+    # files still being written
+    writer.wait()
 
 if __name__ == '__main__':
     main()
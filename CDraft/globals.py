@@ -35,7 +35,7 @@ else:
     from xdg.BaseDirectory import xdg_data_home as data_home
 
 # avoiding circular imports, actual import is below!
-#from utils import FailsafeConfigParser
+#from utils import FailsafeConfigParser, Settings
 
 def get_gnome_fonts():
     """test if gnome font settings exist"""
@@ -56,8 +56,19 @@ def get_gnome_fonts():
     else:
         return fonts
 
-state = dict(
-    gnome_fonts = get_gnome_fonts(),
+class State(dict):
+    """global state, some of it only looked up when it is first used"""
+    lazy = {
+        'gnome_fonts': get_gnome_fonts,
+    }
+
+    def __missing__(self, key):
+        if key not in self.lazy:
+            raise KeyError(key)
+        value = self[key] = self.lazy[key]()
+        return value
+
+state = State(
     absolute_path = os.path.dirname(os.path.abspath(__file__)),
     conf_dir = os.path.join(config_home, 'cdraft'),
     data_dir = os.path.join(data_home, 'cdraft'),
@@ -76,11 +87,15 @@ if not os.path.isdir(state['global_themes_dir']):
 
 # yes imports that are not quite obvious suck but we need to avoid
 # circular imports here
-from utils import FailsafeConfigParser            
+from utils import FailsafeConfigParser, Settings
 config = FailsafeConfigParser()
 config_file = os.path.join(state['conf_dir'], 'cdraft.conf')
 if os.path.isfile(config_file):
     config.readfp(open(config_file, 'r'))
-for d in [state['conf_dir'], state['themes_dir']]:
-    if not os.path.isdir(d):
-        os.makedirs(d)
+settings = Settings(config)
+
+def make_dirs():
+    """create our directories, only done once something is written there"""
+    for d in [state['conf_dir'], state['themes_dir']]:
+        if not os.path.isdir(d):
+            os.makedirs(d)
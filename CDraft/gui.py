@@ -30,14 +30,14 @@ import gobject
 import pango
 import ConfigParser
 import os
-from sys import platform
-if platform == 'win32':
-    data_home = os.environ['APPDATA']
-else:
-    from xdg.BaseDirectory import xdg_data_home as data_home
+import time
 
 from cdraft_error import CDraftError
-from globals import state, config
+from globals import state, settings
+from themes import registry, index, DEFAULT_THEME
+
+# steps of the status fade, it runs at about 10 steps per second
+FADE_STEPS = 15
 
 ORIENTATION = {
         'top':0,
@@ -59,36 +59,19 @@ class Theme(dict):
         theme_filename = self._lookup_theme(theme_name)
         if not theme_filename:
             raise CDraftError(_('theme not found: %s') % theme_name)
-        theme_file = ConfigParser.SafeConfigParser()
-        theme_file.read(theme_filename)
-        self.update(theme_file.items('theme'))
-
-    def __getitem__(self, item):
-        """get default values from our default theme
-
-        this is to handle custom themes from older versions"""
-        try:
-            return dict.__getitem__(self, item)
-        except KeyError:
-            default_theme = Theme('green')
-            return default_theme[item]
+        # settings missing in custom themes from older versions come
+        # from the default theme, so lookups are plain dict hits
+        if theme_name != DEFAULT_THEME:
+            default_filename = self._lookup_theme(DEFAULT_THEME)
+            if default_filename:
+                self.update(registry.load(default_filename))
+        self.update(registry.load(theme_filename))
 
     def _lookup_theme(self, theme_name):
         """lookup theme_filename for given theme_name
 
         order of preference is homedir, global dir, source dir (if available)"""
-        local_directory = os.path.join(data_home, 'cdraft', 'themes')
-        global_directory = '/usr/share/cdraft/themes' # FIXME: platform
-        # in case CDraft is run without installation
-        fallback_directory = os.path.join(
-            os.path.dirname(os.path.abspath(__file__)),
-            '..',
-            'themes'
-        )
-        for dirname in (local_directory, global_directory, fallback_directory):
-            filename = os.path.join(dirname, theme_name + '.theme')
-            if os.path.isfile(filename):
-                return filename
+        return index.lookup(theme_name)
 
     def save(self, filename):
         """save a theme"""
@@ -109,46 +92,106 @@ class FadeLabel(gtk.Label):
         gtk.Label.__init__(self, message)
         if not active_color:
             active_color = '#ffffff'
-        self.active_color = active_color
         if not inactive_color:
             inactive_color = '#000000'
-        self.fade_level = 0
-        self.inactive_color = inactive_color
+        self._active_color = active_color
+        self._inactive_color = inactive_color
+        # colors from inactive to active, built once per pair of colors
+        self.ramp = None
+        # step of the ramp shown, the time the fade starts at and its timer
+        self.fade_step = None
+        self.fade_at = 0
         self.idle = 0
 
+    def _set_active_color(self, color):
+        self._active_color = color
+        self.recolor()
+
+    def _set_inactive_color(self, color):
+        self._inactive_color = color
+        self.recolor()
+
+    def recolor(self):
+        """the colors changed, show the current step in the new ones
+
+        a running fade goes on from that step"""
+        self.ramp = None
+        if self.fade_step is not None:
+            self.modify_fg(gtk.STATE_NORMAL, self.get_ramp()[self.fade_step])
+
+    active_color = property(lambda self: self._active_color,
+                            _set_active_color)
+    inactive_color = property(lambda self: self._inactive_color,
+                              _set_inactive_color)
+
+    def get_ramp(self):
+        """colors of every fade step, from inactive to active"""
+        if self.ramp is None:
+            inactive = gtk.gdk.color_parse(self._inactive_color)
+            active = gtk.gdk.color_parse(self._active_color)
+            self.ramp = []
+            for step in xrange(FADE_STEPS + 1):
+                level = float(step) / FADE_STEPS
+                self.ramp.append(gtk.gdk.Color(
+                    inactive.red + int(level * (active.red - inactive.red)),
+                    inactive.green +
+                    int(level * (active.green - inactive.green)),
+                    inactive.blue + int(level * (active.blue - inactive.blue)),
+                ))
+        return self.ramp
+
+    def show_step(self, step):
+        if step != self.fade_step:
+            self.fade_step = step
+            self.modify_fg(gtk.STATE_NORMAL, self.get_ramp()[step])
+
     def set_text(self, message, duration=None):
         """change text that is displayed
         @param message: message to display
         @param duration: duration in miliseconds"""
         if not duration:
             duration = self.active_duration
-        self.modify_fg(gtk.STATE_NORMAL,
-                       gtk.gdk.color_parse(self.active_color))
+        self.show_step(FADE_STEPS)
         gtk.Label.set_text(self, message)
-        if self.idle:
-            gobject.source_remove(self.idle)
-        self.idle = gobject.timeout_add(duration, self.fade_start)
+        self.fade_at = time.time() + duration / 1000.0
+        # a running timer is reused, fade_start waits for fade_at
+        if not self.idle:
+            self.idle = gobject.timeout_add(duration, self.fade_start)
+
+    def seen(self):
+        """whether the user can see the label fade"""
+        toplevel = self.get_toplevel()
+        if not isinstance(toplevel, gtk.Window) or not toplevel.is_active():
+            return False
+        return toplevel.window is not None and not \
+            toplevel.window.get_state() & gtk.gdk.WINDOW_STATE_ICONIFIED
 
     def fade_start(self):
         """start fading timer"""
-        self.fade_level = 1.0
-        if self.idle:
-            gobject.source_remove(self.idle)
-        self.idle = gobject.timeout_add(25, self.fade_out)
+        remaining = self.fade_at - time.time()
+        if remaining > 0.001:
+            self.idle = gobject.timeout_add(int(remaining * 1000) + 1,
+                                            self.fade_start)
+            return False
+        if not self.seen():
+            # nobody is watching, go straight to the end
+            self.show_step(0)
+            self.idle = 0
+            return False
+        self.idle = gobject.timeout_add(
+            int(self.fade_duration / FADE_STEPS), self.fade_out
+        )
+        return False
 
     def fade_out(self):
         """now fade out"""
-        color = gtk.gdk.color_parse(self.inactive_color)
-        (red1, green1, blue1) = (color.red, color.green, color.blue)
-        color = gtk.gdk.color_parse(self.active_color)
-        (red2, green2, blue2) = (color.red, color.green, color.blue)
-        red = red1 + int(self.fade_level * (red2 - red1))
-        green = green1 + int(self.fade_level * (green2 - green1))
-        blue = blue1 + int(self.fade_level * (blue2 - blue1))
-        self.modify_fg(gtk.STATE_NORMAL, gtk.gdk.Color(red, green, blue))
-        self.fade_level -= 1.0 / (self.fade_duration / 25)
-        if self.fade_level > 0:
+        if time.time() < self.fade_at:
+            # a new message came in, it is shown for its full duration
+            return self.fade_start()
+        self.show_step(self.fade_step - 1)
+        if self.fade_step > 0 and self.seen():
             return True
+        self.show_step(0)
         self.idle = 0
         return False
 
@@ -157,7 +200,7 @@ class GUI(object):
 
     def __init__(self):
         # Theme
-        theme_name = config.get('visual', 'theme')
+        theme_name = settings.visual.theme
         self.theme = Theme(theme_name)
         self.status = FadeLabel()
         self.revision_status = gtk.Label()
@@ -214,106 +257,164 @@ class GUI(object):
         self.status.set_alignment(0.0, 0.5)
         self.status.set_justify(gtk.JUSTIFY_LEFT)
 
-        
+        # what apply_theme applied last, and its pending idle call
+        self.applied_settings = {}
+        self.apply_theme_id = None
+        for option in ('use_font_type', 'custom_font', 'showborder',
+                       'indent', 'linespacing', 'alignment'):
+            settings.subscribe('visual', option,
+                               lambda value: self.queue_apply_theme())
+
+    def effective_settings(self):
+        """the theme and visual settings apply_theme goes by"""
+        visual = settings.visual
+        if visual.use_font_type == 'custom' or not state['gnome_fonts']:
+            font = visual.custom_font
+        else:
+            font = state['gnome_fonts'][visual.use_font_type]
+        effective = dict(
+            (key, self.theme[key]) for key in (
+                'foreground', 'background', 'border', 'textboxbg',
+                'padding', 'width', 'height',
+            )
+        )
+        effective.update(
+            font=font,
+            showborder=visual.showborder,
+            indent=visual.indent,
+            linespacing=visual.linespacing,
+            alignment=visual.alignment,
+        )
+        return effective
+
+    def queue_apply_theme(self):
+        """apply the theme once the main loop is idle
+
+        a burst of preference changes ends up as a single apply"""
+        if self.apply_theme_id is None:
+            self.apply_theme_id = gobject.idle_add(self.apply_queued_theme)
+
+    def apply_queued_theme(self):
+        self.apply_theme_id = None
         self.apply_theme()
+        return False
 
     def apply_theme(self):
         """immediately apply the theme given in configuration
 
         this has changed from previous versions! Takes no arguments!
-        Only uses configuration!"""
-        
-        # text cursor
-        gtkrc_string = """\
-        style "cdraft-colored-cursor" { 
-        GtkTextView::cursor-color = '%s'
-        bg_pixmap[NORMAL] = "<none>"
-        }
-        class "GtkWidget" style "cdraft-colored-cursor"
-        """ % self.theme['foreground']
-        gtk.rc_parse_string(gtkrc_string)
-
-        padding = int(self.theme['padding'])
-        self.textbox.set_border_width(padding)
-        
-        # Screen geometry
-        screen = gtk.gdk.screen_get_default() 
-        root_window = screen.get_root_window() 
-        mouse_x, mouse_y, mouse_mods = root_window.get_pointer()
-        current_monitor_number = screen.get_monitor_at_point(mouse_x, mouse_y)
-        monitor_geometry = screen.get_monitor_geometry(current_monitor_number)
-        (screen_width, screen_height) = (monitor_geometry.width,
-                                         monitor_geometry.height)
-
-        width_percentage = float(self.theme['width'])
-        height_percentage = float(self.theme['height'])
-        
-        # Sizing
-        self.vbox.set_size_request(
-            int(width_percentage * screen_width),
-            int(height_percentage * screen_height)
-        )
+        Only uses configuration! Only what changed since the last call
+        is applied again."""
+        if self.apply_theme_id is not None:
+            # applying now, drop the queued apply
+            gobject.source_remove(self.apply_theme_id)
+            self.apply_theme_id = None
+        effective = self.effective_settings()
+        changed = set([
+            key for key, value in effective.iteritems()
+            if self.applied_settings.get(key) != value
+        ])
+        self.applied_settings = effective
+
+        if 'foreground' in changed:
+            # text cursor
+            gtkrc_string = """\
+            style "cdraft-colored-cursor" { 
+            GtkTextView::cursor-color = '%s'
+            bg_pixmap[NORMAL] = "<none>"
+            }
+            class "GtkWidget" style "cdraft-colored-cursor"
+            """ % effective['foreground']
+            gtk.rc_parse_string(gtkrc_string)
+
+        if 'padding' in changed:
+            self.textbox.set_border_width(int(effective['padding']))
+
+        if changed & set(['width', 'height']):
+            # Screen geometry
+            screen = gtk.gdk.screen_get_default() 
+            root_window = screen.get_root_window() 
+            mouse_x, mouse_y, mouse_mods = root_window.get_pointer()
+            current_monitor_number = screen.get_monitor_at_point(mouse_x,
+                                                                 mouse_y)
+            monitor_geometry = screen.get_monitor_geometry(
+                current_monitor_number
+            )
+            (screen_width, screen_height) = (monitor_geometry.width,
+                                             monitor_geometry.height)
+
+            # Sizing
+            self.vbox.set_size_request(
+                int(float(effective['width']) * screen_width),
+                int(float(effective['height']) * screen_height)
+            )
 
-        parse_color = lambda x: gtk.gdk.color_parse(self.theme[x])
         # Colors
-        self.window.modify_bg(gtk.STATE_NORMAL, parse_color('background'))
-        self.boxout.modify_bg(gtk.STATE_NORMAL, parse_color('border'))
-        self.status.active_color = self.theme['foreground']
-        self.status.inactive_color = self.theme['background']
-        self.revision_status.modify_fg(gtk.STATE_NORMAL, gtk.gdk.color_parse(self.theme['foreground']))
-        self.revision_status.modify_bg(gtk.STATE_NORMAL, gtk.gdk.color_parse(self.theme['background']))
-        self.textbox.modify_bg(gtk.STATE_NORMAL, parse_color('textboxbg'))
-        self.textbox.modify_base(gtk.STATE_NORMAL, parse_color('textboxbg'))
-        self.textbox.modify_base(gtk.STATE_SELECTED, parse_color('foreground'))
-        self.textbox.modify_text(gtk.STATE_NORMAL, parse_color('foreground'))
-        self.textbox.modify_text(gtk.STATE_SELECTED, parse_color('textboxbg'))
-        self.textbox.modify_fg(gtk.STATE_NORMAL, parse_color('foreground'))
+        colors = dict(
+            (key, gtk.gdk.color_parse(effective[key]))
+            for key in ('foreground', 'background', 'border', 'textboxbg')
+            if key in changed
+        )
+        if 'background' in colors:
+            self.window.modify_bg(gtk.STATE_NORMAL, colors['background'])
+            self.status.inactive_color = effective['background']
+            self.revision_status.modify_bg(gtk.STATE_NORMAL,
+                                           colors['background'])
+        if 'border' in colors:
+            self.boxout.modify_bg(gtk.STATE_NORMAL, colors['border'])
+        if 'foreground' in colors:
+            self.status.active_color = effective['foreground']
+            self.revision_status.modify_fg(gtk.STATE_NORMAL,
+                                           colors['foreground'])
+            self.textbox.modify_base(gtk.STATE_SELECTED, colors['foreground'])
+            self.textbox.modify_text(gtk.STATE_NORMAL, colors['foreground'])
+            self.textbox.modify_fg(gtk.STATE_NORMAL, colors['foreground'])
+        if 'textboxbg' in colors:
+            self.textbox.modify_bg(gtk.STATE_NORMAL, colors['textboxbg'])
+            self.textbox.modify_base(gtk.STATE_NORMAL, colors['textboxbg'])
+            self.textbox.modify_text(gtk.STATE_SELECTED, colors['textboxbg'])
 
         # Border
-        if not int(config.get('visual', 'showborder')):
-            self.boxin.set_border_width(0)
-            self.boxout.set_border_width(0)
-        else:
-            self.boxin.set_border_width(1)
-            self.boxout.set_border_width(1)
+        if 'showborder' in changed:
+            border_width = 1 if effective['showborder'] else 0
+            self.boxin.set_border_width(border_width)
+            self.boxout.set_border_width(border_width)
 
         # Fonts
-        if config.get('visual', 'use_font_type') == 'custom' or\
-           not state['gnome_fonts']:
-            new_font = config.get('visual', 'custom_font')
-        else:
-            font_type = config.get('visual', 'use_font_type')
-            new_font = state['gnome_fonts'][font_type]
-        self.textbox.modify_font(pango.FontDescription(new_font))
-        tab_width = pango.TabArray(1, False)
-        tab_width.set_tab(0, pango.TAB_LEFT,
-                calculate_real_tab_width(self.textbox, 4)
-        )
-        self.textbox.set_tabs(tab_width)
-
-        # Indent
-        if config.get('visual', 'indent') == '1':
-            pango_context = self.textbox.get_pango_context()
-            current_font_size = pango_context.\
-                    get_font_description().\
-                    get_size() / 1024
-            self.textbox.set_indent(current_font_size * 2)
-        else:
-            self.textbox.set_indent(0)
+        if 'font' in changed:
+            self.textbox.modify_font(pango.FontDescription(effective['font']))
+            tab_width = pango.TabArray(1, False)
+            tab_width.set_tab(0, pango.TAB_LEFT,
+                    calculate_real_tab_width(self.textbox, 4)
+            )
+            self.textbox.set_tabs(tab_width)
+
+        # Indent, it depends on the font size
+        if changed & set(['indent', 'font']):
+            if effective['indent']:
+                pango_context = self.textbox.get_pango_context()
+                current_font_size = pango_context.\
+                        get_font_description().\
+                        get_size() / 1024
+                self.textbox.set_indent(current_font_size * 2)
+            else:
+                self.textbox.set_indent(0)
 
         # linespacing
-        linespacing = config.getint('visual', 'linespacing')
-        self.textbox.set_pixels_below_lines(linespacing)
-        self.textbox.set_pixels_above_lines(linespacing)
-        self.textbox.set_pixels_inside_wrap(linespacing)
+        if 'linespacing' in changed:
+            linespacing = effective['linespacing']
+            self.textbox.set_pixels_below_lines(linespacing)
+            self.textbox.set_pixels_above_lines(linespacing)
+            self.textbox.set_pixels_inside_wrap(linespacing)
 
         # alignment
-        self.align.set(
-            xalign=0.5,
-            yalign=ORIENTATION[config.get('visual', 'alignment')],
-            xscale=0,
-            yscale=0
-        )
+        if 'alignment' in changed:
+            self.align.set(
+                xalign=0.5,
+                yalign=ORIENTATION[effective['alignment']],
+                xscale=0,
+                yscale=0
+            )
 
     def quit(self):
         """ quit cdraft """
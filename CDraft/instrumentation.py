@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# CDraft, a fork of PyRoom.
+# Copyright (c) 2007 Nicolas P. Rougier & NoWhereMan
+# Copyright (c) 2008 The Pyroom Team - See AUTHORS file for more information
+# Copyright (c) 2011 Matthew Bunday
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+
+"""
+performance counters
+
+Counters are cheap enough to stay in the code, they only report to
+stderr when cdraft is started with --instrument.
+"""
+
+import sys
+import time
+
+import gobject
+
+from globals import state
+
+def report(message):
+    """write message to stderr if instrumentation is switched on"""
+    if state.get('instrument'):
+        sys.stderr.write('cdraft: %s\n' % message)
+
+class RateCounter(object):
+    """count events and report how many happen per second"""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.started = time.time()
+        self.rate = 0.0
+
+    def tick(self):
+        self.count += 1
+        now = time.time()
+        if now - self.started >= 1:
+            self.rate = self.count / (now - self.started)
+            self.count = 0
+            self.started = now
+            report('%s: %.1f/s' % (self.name, self.rate))
+
+class LatencyHistogram(object):
+    """collect durations in buckets of powers of two milliseconds"""
+
+    def __init__(self, name, report_every=10):
+        self.name = name
+        self.report_every = report_every
+        self.buckets = [0] * 16
+        self.samples = 0
+
+    def add(self, seconds):
+        milliseconds = int(seconds * 1000)
+        bucket = 0
+        while milliseconds and bucket < len(self.buckets) - 1:
+            milliseconds >>= 1
+            bucket += 1
+        self.buckets[bucket] += 1
+        self.samples += 1
+        if not self.samples % self.report_every:
+            report('%s: %s' % (self.name, self))
+
+    def time(self, function, *args):
+        """call function and add the time it took"""
+        started = time.time()
+        try:
+            return function(*args)
+        finally:
+            self.add(time.time() - started)
+
+    def __str__(self):
+        return ' '.join([
+            '<%dms:%d' % (1 << bucket, count)
+            for bucket, count in enumerate(self.buckets) if count
+        ])
+
+def report_ready(widget, started):
+    """report the time from started until widget is drawn for the first
+    time and the main loop is idle, ready for the first keystroke"""
+    def ready():
+        report('ready for input after %d ms' %
+               ((time.time() - started) * 1000))
+        return False
+
+    def exposed(widget, event):
+        widget.disconnect(handler_id)
+        gobject.idle_add(ready)
+
+    handler_id = widget.connect('expose-event', exposed)
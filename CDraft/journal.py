@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# CDraft, a fork of PyRoom.
+# Copyright (c) 2007 Nicolas P. Rougier & NoWhereMan
+# Copyright (c) 2008 The Pyroom Team - See AUTHORS file for more information
+# Copyright (c) 2011 Matthew Bunday
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+"""
+append-only journal of revision tree edits
+
+Saving appends the edits made since the last save to the journal, which
+belongs to the snapshot written by revision_store. Once the journal
+grows too long it is compacted into a new snapshot. Records and
+snapshots are encoded when saving, the files are written by the writer
+thread. The journal starts
+with the length and crc32 of the snapshot text it applies to, followed
+by records:
+
+    'I' offset:u32 size:u32 utf-8 text    insert
+    'D' start:u32 end:u32                 delete
+    'R' start:u32 end:u32                 revise
+    'C'                                   commit
+"""
+
+import os
+import struct
+
+import revision_store
+from utils import atomic_write
+import writer
+
+MAGIC = 'CDJL'
+VERSION = 1
+HEADER = struct.Struct('<4sBII')
+RANGE = struct.Struct('<II')
+INSERT, DELETE, REVISE, COMMIT = 'I', 'D', 'R', 'C'
+
+# compact once the journal holds this many records
+COMPACT_RECORDS = 5000
+
+def get_journal_filename(filename):
+    """get the filename the journal of filename is kept in"""
+    return revision_store.get_revisions_filename(filename) + '-journal'
+
+class Journal(object):
+    """edits of a revision tree since its last snapshot"""
+
+    def __init__(self):
+        self.pending = []
+        self.records = 0
+        # document filename the journal on disk belongs to
+        self.filename = None
+
+    def insert(self, offset, text):
+        encoded = text.encode('utf-8')
+        self.pending.append(
+            INSERT + RANGE.pack(offset, len(encoded)) + encoded
+        )
+
+    def delete(self, start_offset, end_offset):
+        self.pending.append(DELETE + RANGE.pack(start_offset, end_offset))
+
+    def revise(self, start_offset, end_offset):
+        self.pending.append(REVISE + RANGE.pack(start_offset, end_offset))
+
+    def commit(self):
+        self.pending.append(COMMIT)
+
+    def save(self, filename, text, failed):
+        """persist the revision tree `text` of filename
+
+        only the pending records are written, unless the journal has to
+        be compacted. failed(error) is called from the writer thread if
+        writing goes wrong."""
+        if self.filename != filename or \
+           self.records + len(self.pending) > COMPACT_RECORDS:
+            self.compact(filename, text, failed)
+            return
+        if not self.pending:
+            return
+        records = ''.join(self.pending)
+        # updated before the job is queued, so a failing job is the last
+        # to touch filename
+        self.records += len(self.pending)
+        self.pending = []
+        writer.queue_job(self.write_records, filename, records, failed)
+
+    def compact(self, filename, text, failed):
+        """write a new snapshot and start an empty journal on top of it"""
+        snapshot = revision_store.encode(text)
+        # the journal belongs to the document the snapshot belongs to
+        magic, version, length, crc = \
+                revision_store.HEADER.unpack_from(snapshot, 0)
+        self.filename = filename
+        self.records = 0
+        self.pending = []
+        writer.queue_job(self.write_snapshot, filename, snapshot,
+                         HEADER.pack(MAGIC, VERSION, length, crc), failed)
+
+    def write_records(self, filename, records, failed):
+        """append encoded records to the journal, runs in the writer thread"""
+        try:
+            append_journal(filename, records)
+        except (IOError, OSError), error:
+            self.write_failed(error, failed)
+
+    def write_snapshot(self, filename, snapshot, header, failed):
+        """replace snapshot and journal, runs in the writer thread"""
+        try:
+            atomic_write(revision_store.get_revisions_filename(filename),
+                         snapshot)
+            atomic_write(get_journal_filename(filename), header)
+        except (IOError, OSError), error:
+            self.write_failed(error, failed)
+
+    def write_failed(self, error, failed):
+        # what is on disk is unknown now, the next save compacts
+        self.filename = None
+        failed(error)
+
+def append_journal(filename, data):
+    """append data to the journal of filename"""
+    journal_file = open(get_journal_filename(filename), 'ab')
+    try:
+        journal_file.write(data)
+    finally:
+        journal_file.close()
+
+def replay(text, data):
+    """apply the encoded records in data to text, returns their number"""
+    offset = records = 0
+    while offset < len(data):
+        kind = data[offset]
+        offset += 1
+        if kind == COMMIT:
+            records += 1
+            continue
+        start, end = RANGE.unpack_from(data, offset)
+        offset += RANGE.size
+        if kind == INSERT:
+            text.insert_text(data[offset:offset + end].decode('utf-8'), start)
+            offset += end
+        elif kind == DELETE:
+            text.delete_text(start, end)
+        elif kind == REVISE:
+            text.revise(start, end)
+        else:
+            raise ValueError('unknown journal record %r' % kind)
+        records += 1
+    return records
+
+def load(filename, document):
+    """load snapshot and journal of filename
+
+    returns the revision tree and its journal, or (None, None) if there
+    is nothing to load or it doesn't match document"""
+    text = revision_store.load(
+        revision_store.get_revisions_filename(filename), None
+    )
+    journal_filename = get_journal_filename(filename)
+    if text is None or not os.path.isfile(journal_filename):
+        return None, None
+    journal_file = open(journal_filename, 'rb')
+    try:
+        data = journal_file.read()
+    finally:
+        journal_file.close()
+    if len(data) < HEADER.size:
+        return None, None
+    magic, version, length, crc = HEADER.unpack_from(data, 0)
+    snapshot = text.get_text()
+    if magic != MAGIC or version != VERSION or length != len(snapshot) or \
+       crc != revision_store.checksum(snapshot):
+        return None, None
+    journal = Journal()
+    try:
+        journal.records = replay(text, data[HEADER.size:])
+    except (IndexError, ValueError, struct.error):
+        # truncated or broken journal
+        return None, None
+    if text.get_text() != document:
+        return None, None
+    journal.filename = filename
+    return text, journal
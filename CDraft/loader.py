@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# CDraft, a fork of PyRoom.
+# Copyright (c) 2007 Nicolas P. Rougier & NoWhereMan
+# Copyright (c) 2008 The Pyroom Team - See AUTHORS file for more information
+# Copyright (c) 2011 Matthew Bunday
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+
+"""
+load files into text buffers a chunk at a time
+
+The file is read and decoded incrementally and the buffer is filled
+while the main loop is idle, so the first screen shows up right away
+and the editor stays responsive while the rest of a large file streams
+in. Files can also be read and decoded ahead in a worker thread.
+"""
+
+import codecs
+import os
+
+import gobject
+
+# bytes read per chunk, and inserted per idle callback
+CHUNK_SIZE = 256 * 1024
+
+def read_chunks(source):
+    """yield (bytes read, decoded text) for the chunks of an open file
+
+    the file is closed once it is read or the generator is closed"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        while True:
+            data = source.read(CHUNK_SIZE)
+            yield len(data), decoder.decode(data, not data)
+            if not data:
+                return
+    finally:
+        source.close()
+
+def prefetch(filename):
+    """read and decode all of filename, returns (size, chunks, error)
+
+    meant to run in a worker thread, so errors are returned, not raised"""
+    try:
+        source = open(filename, 'rb')
+        size = os.fstat(source.fileno()).st_size
+        return size, list(read_chunks(source)), None
+    except (IOError, UnicodeDecodeError), error:
+        return 0, [], error
+
+class StreamingLoader(object):
+    """fill a buffer with chunks of (bytes read, decoded text)
+
+    progress(fraction) is called after every chunk, done() once all of
+    size bytes are in the buffer and failed(error) if reading or decoding
+    goes wrong"""
+
+    def __init__(self, buf, chunks, size, progress, done, failed):
+        self.buf = buf
+        self.chunks = iter(chunks)
+        self.size = size
+        self.progress = progress
+        self.done = done
+        self.failed = failed
+        self.read = 0
+        self.idle_id = None
+        # chunks go in here, the buffer can be edited while loading and
+        # text typed at the end has to stay behind the file
+        self.end_mark = buf.create_mark(None, buf.get_end_iter(), True)
+        buf.loader = self
+        buf.begin_not_undoable_action()
+        # the first screen is filled right away
+        if self.load_chunk():
+            buf.place_cursor(buf.get_start_iter())
+            self.idle_id = gobject.idle_add(self.load_chunk)
+
+    def load_chunk(self):
+        """load the next chunk, returns whether there is more to load"""
+        try:
+            read, text = self.chunks.next()
+        except StopIteration:
+            read, text = 0, u''
+        except (IOError, UnicodeDecodeError), error:
+            self.finish()
+            self.failed(error)
+            return False
+        if text:
+            position = self.buf.get_iter_at_mark(self.end_mark)
+            self.buf.insert(position, text)
+            self.buf.move_mark(self.end_mark, position)
+        self.read += read
+        if not read:
+            self.finish()
+            self.done()
+            return False
+        self.progress(float(self.read) / max(self.size, 1))
+        return True
+
+    def finish(self):
+        if hasattr(self.chunks, 'close'):
+            self.chunks.close()
+        self.buf.end_not_undoable_action()
+        self.buf.delete_mark(self.end_mark)
+        self.buf.loader = None
+
+    def cancel(self):
+        """stop loading, the buffer keeps what has been loaded so far"""
+        if self.idle_id is not None:
+            gobject.source_remove(self.idle_id)
+        self.finish()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# CDraft, a fork of PyRoom.
+# Copyright (c) 2007 Nicolas P. Rougier & NoWhereMan
+# Copyright (c) 2008 The Pyroom Team - See AUTHORS file for more information
+# Copyright (c) 2011 Matthew Bunday
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+
+"""
+read-only access to huge files through mmap
+
+The file is never read into memory as a whole. A background thread
+counts the newlines in every block of the mapped file, so the start of
+a line is found by a binary search over the blocks and a scan through a
+single block, and only the lines that are shown get decoded.
+"""
+
+import bisect
+import mmap
+import os
+import threading
+from array import array
+
+# bytes per block of the line index
+INDEX_BLOCK = 64 * 1024
+# never decode more than this at once, even if the lines are that long
+MAX_WINDOW_BYTES = 4 * 1024 * 1024
+
+class MappedFile(object):
+    """a memory mapped file with a sparse index of its lines"""
+
+    def __init__(self, filename):
+        mapped_file = open(filename, 'rb')
+        try:
+            if os.fstat(mapped_file.fileno()).st_size:
+                self.mapping = mmap.mmap(mapped_file.fileno(), 0,
+                                         access=mmap.ACCESS_READ)
+            else:
+                self.mapping = ''
+        finally:
+            mapped_file.close()
+        # block_lines[i] is the number of newlines before block i
+        self.block_lines = array('L', [0])
+        self.complete = False
+        self.closed = False
+        self.indexer = threading.Thread(target=self.build_index,
+                                        name='line index')
+        self.indexer.setDaemon(True)
+        self.indexer.start()
+
+    def __len__(self):
+        return len(self.mapping)
+
+    def build_index(self):
+        """count the newlines of every block, runs in the indexer thread"""
+        for start in xrange(0, len(self.mapping), INDEX_BLOCK):
+            if self.closed:
+                return
+            newlines = self.mapping[start:start + INDEX_BLOCK].count('\n')
+            self.block_lines.append(self.block_lines[-1] + newlines)
+        self.complete = True
+
+    def line_start(self, line):
+        """byte offset the line starts at, None if there is no such line
+
+        lines past the indexed blocks are found by scanning on from the
+        last of them"""
+        if line == 0:
+            return 0
+        block = bisect.bisect_left(self.block_lines, line) - 1
+        position = block * INDEX_BLOCK
+        for i in xrange(line - self.block_lines[block]):
+            position = self.mapping.find('\n', position) + 1
+            if not position:
+                return None
+        return position
+
+    def lines(self, first, count):
+        """decoded text of count lines starting with line first"""
+        start = self.line_start(first)
+        if start is None:
+            return u''
+        end = self.line_start(first + count)
+        if end is None:
+            end = len(self.mapping)
+        else:
+            # without the newline ending the last line
+            end -= 1
+        end = min(end, start + MAX_WINDOW_BYTES)
+        return self.mapping[start:end].decode('utf-8', 'replace')
+
+    def close(self):
+        self.closed = True
+        self.indexer.join()
+        if self.mapping:
+            self.mapping.close()
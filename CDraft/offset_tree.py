@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# CDraft, a fork of PyRoom.
+# Copyright (c) 2007 Nicolas P. Rougier & NoWhereMan
+# Copyright (c) 2008 The Pyroom Team - See AUTHORS file for more information
+# Copyright (c) 2011 Matthew Bunday
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+"""
+ordered sequence of items indexed by cumulative length
+
+Every item carries a length; the tree answers "which item covers this
+offset" and "where does item n start" in O(log n). It is an implicit treap,
+so positions are never stored, only subtree sizes.
+"""
+
+import random
+
+class _Node(object):
+    """a single item in the tree"""
+    __slots__ = ('item', 'length', 'priority', 'left', 'right',
+                 'count', 'total')
+
+    def __init__(self, item, length):
+        self.item = item
+        self.length = length
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+        self.count = 1
+        self.total = length
+
+def _update(node):
+    """recompute the subtree sums of node from its children"""
+    node.count = 1
+    node.total = node.length
+    if node.left is not None:
+        node.count += node.left.count
+        node.total += node.left.total
+    if node.right is not None:
+        node.count += node.right.count
+        node.total += node.right.total
+
+def _split(node, index):
+    """split into a tree of the first `index` items and one of the rest"""
+    if node is None:
+        return None, None
+    left_count = node.left.count if node.left is not None else 0
+    if index <= left_count:
+        left, node.left = _split(node.left, index)
+        _update(node)
+        return left, node
+    else:
+        node.right, right = _split(node.right, index - left_count - 1)
+        _update(node)
+        return node, right
+
+def _merge(left, right):
+    """join two trees, all items of left come first"""
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        _update(left)
+        return left
+    else:
+        right.left = _merge(left, right.left)
+        _update(right)
+        return right
+
+class OffsetTree(object):
+    """sequence of (item, length) pairs with O(log n) offset lookups"""
+    __slots__ = ('root',)
+
+    def __init__(self, items=()):
+        self.root = None
+        for item, length in items:
+            self.insert(len(self), item, length)
+
+    def __len__(self):
+        """number of items"""
+        return self.root.count if self.root is not None else 0
+
+    def __iter__(self):
+        """iterate over (item, length) pairs in order"""
+        stack = []
+        node = self.root
+        while stack or node is not None:
+            if node is not None:
+                stack.append(node)
+                node = node.left
+            else:
+                node = stack.pop()
+                yield node.item, node.length
+                node = node.right
+
+    def __getitem__(self, index):
+        return self._node(index).item
+
+    @property
+    def length(self):
+        """sum of all item lengths"""
+        return self.root.total if self.root is not None else 0
+
+    def _node(self, index):
+        """get the node at position index"""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        node = self.root
+        while True:
+            left_count = node.left.count if node.left is not None else 0
+            if index < left_count:
+                node = node.left
+            elif index == left_count:
+                return node
+            else:
+                index -= left_count + 1
+                node = node.right
+
+    def find(self, offset, after=False):
+        """find the item covering offset
+
+        returns (index, start, item, length). At the border between two
+        items the left one wins, unless `after` is set: then the item
+        holding the character at offset is returned."""
+        if not 0 <= offset <= self.length or self.root is None:
+            raise IndexError(offset)
+        node = self.root
+        index = start = 0
+        while node is not None:
+            left_count, left_total = 0, 0
+            if node.left is not None:
+                left_count, left_total = node.left.count, node.left.total
+            if node.left is not None and (offset < left_total or
+                                          not after and offset == left_total):
+                node = node.left
+                continue
+            offset -= left_total
+            index += left_count
+            start += left_total
+            if offset < node.length or not after and offset == node.length:
+                return index, start, node.item, node.length
+            offset -= node.length
+            index += 1
+            start += node.length
+            node = node.right
+        raise IndexError(offset)
+
+    def start_of(self, index):
+        """offset at which the item at index starts"""
+        if not 0 <= index <= len(self):
+            raise IndexError(index)
+        node = self.root
+        start = 0
+        while node is not None:
+            left_count, left_total = 0, 0
+            if node.left is not None:
+                left_count, left_total = node.left.count, node.left.total
+            if index <= left_count:
+                node = node.left
+            else:
+                index -= left_count + 1
+                start += left_total + node.length
+                node = node.right
+        return start
+
+    def length_of(self, index):
+        """length of the item at index"""
+        return self._node(index).length
+
+    def insert(self, index, item, length):
+        """insert item before position index"""
+        left, right = _split(self.root, index)
+        self.root = _merge(_merge(left, _Node(item, length)), right)
+
+    def pop(self, index):
+        """remove and return the item at index"""
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        left, right = _split(self.root, index)
+        node, right = _split(right, 1)
+        self.root = _merge(left, right)
+        return node.item
+
+    def set_item(self, index, item):
+        """replace the item at index, keeping its length"""
+        self._node(index).item = item
+
+    def set_length(self, index, length):
+        """change the length of the item at index"""
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        delta = length - self._node(index).length
+        node = self.root
+        while True:
+            node.total += delta
+            left_count = node.left.count if node.left is not None else 0
+            if index < left_count:
+                node = node.left
+            elif index == left_count:
+                node.length = length
+                return
+            else:
+                index -= left_count + 1
+                node = node.right
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# CDraft, a fork of PyRoom.
+# Copyright (c) 2007 Nicolas P. Rougier & NoWhereMan
+# Copyright (c) 2008 The Pyroom Team - See AUTHORS file for more information
+# Copyright (c) 2011 Matthew Bunday
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+
+"""
+count the paragraphs of a gtk.TextBuffer as it is edited
+
+A paragraph starts at every line that isn't blank and follows a blank
+line or the start of the text. An edit can only change that for the
+lines it touches and the line after them, so only those are looked at,
+once before and once after the edit.
+"""
+
+def paragraph_starts(lines, previous_blank=True):
+    """number of paragraphs starting in lines"""
+    count = 0
+    for line in lines:
+        blank = not line.strip()
+        if previous_blank and not blank:
+            count += 1
+        previous_blank = blank
+    return count
+
+class ParagraphCounter(object):
+    """paragraph count of a text buffer, kept up to date on edits"""
+    __slots__ = ('text_buffer', 'paragraphs', 'first_line', 'before')
+
+    def __init__(self, text_buffer):
+        self.text_buffer = text_buffer
+        self.paragraphs = 0
+        # first line touched by the running edit and the paragraphs
+        # starting around it before the edit
+        self.first_line = 0
+        self.before = 0
+        text_buffer.connect('insert-text', self.on_insert_text)
+        text_buffer.connect_after('insert-text', self.after_insert_text)
+        text_buffer.connect('delete-range', self.on_delete_range)
+        text_buffer.connect_after('delete-range', self.after_delete_range)
+
+    def count(self, first_line, last_line):
+        """paragraphs starting in the lines first_line to last_line"""
+        buf = self.text_buffer
+        last_line = min(last_line, buf.get_line_count() - 1)
+        start = buf.get_iter_at_line(max(first_line - 1, 0))
+        if last_line + 1 < buf.get_line_count():
+            end = buf.get_iter_at_line(last_line + 1)
+        else:
+            end = buf.get_end_iter()
+        lines = buf.get_text(start, end).split('\n')
+        previous_blank = True
+        if first_line > 0:
+            previous_blank = not lines.pop(0).strip()
+        return paragraph_starts(lines, previous_blank)
+
+    def on_insert_text(self, text_buffer, pos_iter, text, length):
+        self.first_line = pos_iter.get_line()
+        self.before = self.count(self.first_line, self.first_line + 1)
+
+    def after_insert_text(self, text_buffer, pos_iter, text, length):
+        # pos_iter now points behind the inserted text
+        self.paragraphs += self.count(self.first_line,
+                                      pos_iter.get_line() + 1) - self.before
+
+    def on_delete_range(self, text_buffer, start_iter, end_iter):
+        self.first_line = start_iter.get_line()
+        self.before = self.count(self.first_line, end_iter.get_line() + 1)
+
+    def after_delete_range(self, text_buffer, start_iter, end_iter):
+        self.paragraphs += self.count(self.first_line,
+                                      self.first_line + 1) - self.before
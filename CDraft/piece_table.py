@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# CDraft, a fork of PyRoom.
+# Copyright (c) 2007 Nicolas P. Rougier & NoWhereMan
+# Copyright (c) 2008 The Pyroom Team - See AUTHORS file for more information
+# Copyright (c) 2011 Matthew Bunday
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+"""
+piece table text storage
+
+The text is never copied on edits: the original text stays untouched,
+typed text is appended to an add buffer and a tree of pieces describes
+which parts of both buffers make up the document.
+"""
+
+from array import array
+
+from offset_tree import OffsetTree
+
+ORIGINAL, ADDED = 0, 1
+
+def to_unicode(text):
+    """gtk hands us utf-8 encoded str, we work on unicode"""
+    if isinstance(text, str):
+        return text.decode('utf-8')
+    return text
+
+class PieceTable(object):
+    """editable text made of pieces of an original and an add buffer"""
+    __slots__ = ('original', 'added', 'pieces', 'cached_text')
+
+    def __init__(self, text=u''):
+        self.original = to_unicode(text)
+        self.added = array('u')
+        self.pieces = OffsetTree()
+        self.cached_text = self.original
+        if self.original:
+            self.pieces.insert(0, (ORIGINAL, 0), len(self.original))
+
+    def __len__(self):
+        return self.pieces.length
+
+    def _piece_text(self, piece, length):
+        """get the text a piece is pointing to"""
+        source, start = piece
+        if source == ORIGINAL:
+            return self.original[start:start + length]
+        return self.added[start:start + length].tounicode()
+
+    def get_text(self):
+        """the complete text, only rebuilt after edits"""
+        if self.cached_text is None:
+            self.cached_text = u''.join([
+                self._piece_text(piece, length)
+                for piece, length in self.pieces
+            ])
+        return self.cached_text
+
+    def insert(self, offset, text):
+        """insert text at offset"""
+        text = to_unicode(text)
+        if not text:
+            return
+        self.cached_text = None
+        added_start = len(self.added)
+        self.added.fromunicode(text)
+        if not len(self.pieces):
+            self.pieces.insert(0, (ADDED, added_start), len(text))
+            return
+        index, start, (source, piece_start), length = self.pieces.find(offset)
+        split = offset - start
+        if split == length and source == ADDED and \
+           piece_start + length == added_start:
+            # continued typing, just grow the last piece
+            self.pieces.set_length(index, length + len(text))
+        elif split == 0:
+            self.pieces.insert(index, (ADDED, added_start), len(text))
+        elif split == length:
+            self.pieces.insert(index + 1, (ADDED, added_start), len(text))
+        else:
+            self.pieces.set_length(index, split)
+            self.pieces.insert(index + 1, (source, piece_start + split),
+                               length - split)
+            self.pieces.insert(index + 1, (ADDED, added_start), len(text))
+
+    def delete(self, start_offset, end_offset):
+        """delete the text between start_offset and end_offset"""
+        end_offset = min(end_offset, len(self))
+        if end_offset > start_offset:
+            self.cached_text = None
+        while end_offset > start_offset:
+            index, start, (source, piece_start), length = \
+                    self.pieces.find(start_offset, after=True)
+            cut_from = start_offset - start
+            cut_to = min(end_offset - start, length)
+            if cut_from == 0 and cut_to == length:
+                self.pieces.pop(index)
+            elif cut_from == 0:
+                self.pieces.set_item(index, (source, piece_start + cut_to))
+                self.pieces.set_length(index, length - cut_to)
+            elif cut_to == length:
+                self.pieces.set_length(index, cut_from)
+            else:
+                self.pieces.set_length(index, cut_from)
+                self.pieces.insert(index + 1, (source, piece_start + cut_to),
+                                   length - cut_to)
+            end_offset -= cut_to - cut_from
@@ -32,7 +32,7 @@ import os
 
 from gui import Theme
 from cdraft_error import CDraftError
-from globals import state, config
+from globals import state, config, settings, make_dirs
 from utils import get_themes_list, FailsafeConfigParser
 
 class Preferences(object):
@@ -60,11 +60,11 @@ class Preferences(object):
         self.autosave_spinbutton = builder.get_object("autosavetime")
         self.linespacing_spinbutton = builder.get_object("linespacing")
         self.indent_check = builder.get_object("indent_check")
-        if config.get('visual', 'indent') == '1':
+        if settings.visual.indent:
             self.indent_check.set_active(True)
         self.save_custom_button = builder.get_object("save_custom_theme")
         self.custom_font_preference = builder.get_object("fontbutton1")
-        if not config.get('visual', 'use_font_type') == 'custom':
+        if not settings.visual.use_font_type == 'custom':
             self.custom_font_preference.set_sensitive(False)
         self.font_radios = {
             'document':builder.get_object("radio_document_font"),
@@ -88,26 +88,17 @@ class Preferences(object):
             self.customfile.add_section('theme')
 
         # Getting preferences from conf file
-        active_style = config.get("visual", "theme")
-        self.autosave.set_active(config.getint('editor', 'autosave'))
+        active_style = settings.visual.theme
+        self.autosave.set_active(settings.editor.autosave)
 
         # Set up cdraft from conf file
-        self.linespacing_spinbutton.set_value(int(
-            config.get('visual', 'linespacing')
-        ))
-        self.autosave_spinbutton.set_value(float(
-            config.get('editor', 'autosavetime')))
-        self.showborderbutton.set_active(
-                config.getint('visual', 'showborder')
-        )
-        self.showpathbutton.set_active(
-                config.getint('visual', 'showpath')
-        )
-        font_type = config.get('visual', 'use_font_type')
+        self.linespacing_spinbutton.set_value(settings.visual.linespacing)
+        self.autosave_spinbutton.set_value(settings.editor.autosavetime)
+        self.showborderbutton.set_active(settings.visual.showborder)
+        self.showpathbutton.set_active(settings.visual.showpath)
+        font_type = settings.visual.use_font_type
         self.font_radios[font_type].set_active(True)
-        self.orientation_radios[
-                config.get('visual', 'alignment')
-                ].set_active(True)
+        self.orientation_radios[settings.visual.alignment].set_active(True)
         self.toggleautosave(self.autosave)
 
         self.window.set_transient_for(state['gui'].window)
@@ -115,7 +106,7 @@ class Preferences(object):
         self.stylesvalues = {'custom': 0}
         startingvalue = 1
 
-        state['gui'].theme = Theme(config.get('visual', 'theme'))
+        state['gui'].theme = Theme(settings.visual.theme)
         # Add themes to combobox
         for i in get_themes_list():
             self.stylesvalues['%s' % (i)] = startingvalue
@@ -164,21 +155,19 @@ class Preferences(object):
     def change_orientation(self, widget):
         """change orientation of the main textbox"""
         orientation = widget.get_name().split('_')[1]
-        config.set('visual', 'alignment', orientation)
-        state['gui'].apply_theme()
+        settings.set('visual', 'alignment', orientation)
 
     def change_font(self, widget):
         """apply changed fonts"""
         if widget.get_name() in ('fontbutton1', 'radio_custom_font'):
             self.custom_font_preference.set_sensitive(True)
             new_font = self.custom_font_preference.get_font_name()
-            config.set('visual', 'use_font_type', 'custom')
-            config.set('visual', 'custom_font', new_font)
+            settings.set('visual', 'use_font_type', 'custom')
+            settings.set('visual', 'custom_font', new_font)
         else:
             self.custom_font_preference.set_sensitive(False)
             font_type = widget.get_name().split('_')[1]
-            config.set('visual', 'use_font_type', font_type)
-        state['gui'].apply_theme()
+            settings.set('visual', 'use_font_type', font_type)
     
     def get_custom_data(self):
         """reads custom themes"""
@@ -205,6 +194,7 @@ class Preferences(object):
             gtk.STOCK_SAVE, gtk.RESPONSE_OK)
         )
         chooser.set_default_response(gtk.RESPONSE_OK)
+        make_dirs()
         chooser.set_current_folder(state['themes_dir'])
         filter_pattern = gtk.FileFilter()
         filter_pattern.add_pattern('*.theme')
@@ -224,10 +214,11 @@ class Preferences(object):
     def set_preferences(self, widget, data=None):
         """save preferences"""
         autosavepref = int(self.autosave.get_active())
-        config.set("editor", "autosave", str(autosavepref))
+        settings.set("editor", "autosave", autosavepref)
         autosave_time = self.autosave_spinbutton.get_value_as_int()
-        config.set("editor", "autosavetime", str(autosave_time))
+        settings.set("editor", "autosavetime", autosave_time)
 
+        make_dirs()
         if self.presetscombobox.get_active_text().lower() == 'custom':
             custom_theme = open(os.path.join(
                 state['themes_dir'], 'custom.theme'),
@@ -253,7 +244,7 @@ class Preferences(object):
     def fill_pref_dialog(self):
         """load config into the dialog"""
         self.custom_font_preference.set_font_name(
-            config.get('visual', 'custom_font')
+            settings.visual.custom_font
         )
         parse_color = lambda x: gtk.gdk.color_parse(
             state['gui'].theme[x]
@@ -282,7 +273,7 @@ class Preferences(object):
             custom_theme = Theme('custom')
             custom_theme['name'] = 'custom'
             custom_theme.update(self.get_custom_data())
-            config.set("visual", "theme", str(active_theme))
+            settings.set("visual", "theme", active_theme)
             state['gui'].theme = custom_theme
             self.save_custom_button.set_sensitive(True)
         else:
@@ -304,11 +295,11 @@ class Preferences(object):
             self.heightpreference.set_value(
                 float(state['gui'].theme['height']) * 100
             )
-            config.set("visual", "theme", str(active_theme))
+            settings.set("visual", "theme", active_theme)
             self.presetscombobox.set_active(active_theme_id)
             self.save_custom_button.set_sensitive(False)
 
-        state['gui'].apply_theme()
+        state['gui'].queue_apply_theme()
         state['gui'].status.set_text(_('Style Changed to %s') %
                                         (active_theme))
 
@@ -319,48 +310,33 @@ class Preferences(object):
 
     def toggle_indent(self, widget):
         """toggle textbox indent"""
-        if config.get('visual', 'indent') == '1':
-            config.set('visual', 'indent', '0')
-        else:
-            config.set('visual', 'indent', '1')
-        state['gui'].apply_theme()
+        settings.set('visual', 'indent', int(not settings.visual.indent))
 
     def toggleborder(self, widget):
         """toggle border display"""
-        borderstate = config.getint('visual', 'showborder')
-        if borderstate:
-            opposite = 0
-        else:
-            opposite = 1
-        config.set('visual', 'showborder', str(opposite))
-        state['gui'].apply_theme()
+        settings.set('visual', 'showborder',
+                     int(not settings.visual.showborder))
         
     def togglepath(self, widget):
         """toggle full path display in statusbar"""
-        pathstate = config.getint('visual', 'showpath')
-        if pathstate:
-            opposite = 0
-        else:
-            opposite = 1
-        config.set('visual', 'showpath', str(opposite))
+        settings.set('visual', 'showpath', int(not settings.visual.showpath))
 
     def changelinespacing(self, widget):
         """Change line spacing"""
         linespacing = self.linespacing_spinbutton.get_value()
-        config.set("visual", "linespacing", str(int(linespacing)))
-        state['gui'].apply_theme()
+        settings.set("visual", "linespacing", int(linespacing))
 
     def toggleautosave(self, widget):
         """enable or disable autosave"""
         if self.autosave.get_active():
             self.autosave_spinbutton.set_sensitive(True)
             autosave_time = self.autosave_spinbutton.get_value_as_int()
-            config.set('editor', 'autosave', '1')
+            settings.set('editor', 'autosave', 1)
         else:
             self.autosave_spinbutton.set_sensitive(False)
             autosave_time = 0
-            config.set('editor', 'autosave', '0')
-        config.set('editor', 'autosavetime', str(autosave_time))
+            settings.set('editor', 'autosave', 0)
+        settings.set('editor', 'autosavetime', autosave_time)
 
     def QuitEvent(self, widget, data=None):
         """quit our app"""
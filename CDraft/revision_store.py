@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# CDraft, a fork of PyRoom.
+# Copyright (c) 2007 Nicolas P. Rougier & NoWhereMan
+# Copyright (c) 2008 The Pyroom Team - See AUTHORS file for more information
+# Copyright (c) 2011 Matthew Bunday
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+"""
+keep revision trees on disk
+
+The file starts with a header (magic, version, length and crc32 of the
+document text it belongs to), followed by the segments of the Text:
+
+    segments:  count:u32 segment*
+    segment:   'S' size:u32 utf-8 text
+             | 'T' selected:u32 count:u32 (size:u32 segments)*
+
+Every alternative is prefixed with its size.
+"""
+
+import os
+import struct
+import zlib
+
+from offset_tree import OffsetTree
+from revision_tree import Text, TextSelection, SimpleText
+from utils import atomic_write
+
+MAGIC = 'CDRV'
+VERSION = 1
+HEADER = struct.Struct('<4sBII')
+UINT = struct.Struct('<I')
+SIMPLE, SELECTION = 'S', 'T'
+
+def get_revisions_filename(filename):
+    """get the filename the revisions of filename are kept in"""
+    SUFFIX = ".cdraft-revisions"
+    return os.path.join(
+        os.path.dirname(filename),
+        ".%s%s" % (os.path.basename(filename), SUFFIX)
+    )
+
+def checksum(text):
+    """crc32 of the document text"""
+    return zlib.crc32(text.encode('utf-8')) & 0xffffffff
+
+def read_segments(data, offset, parent):
+    """read a list of segments, returns them and the offset after them"""
+    count, = UINT.unpack_from(data, offset)
+    offset += UINT.size
+    segments = OffsetTree()
+    for i in xrange(count):
+        segment, offset = read_segment(data, offset, parent)
+        segments.insert(len(segments), segment, len(segment))
+    return segments, offset
+
+def read_segment(data, offset, parent):
+    """read a single segment, returns it and the offset after it"""
+    kind = data[offset]
+    offset += 1
+    if kind == SIMPLE:
+        size, = UINT.unpack_from(data, offset)
+        offset += UINT.size
+        text = data[offset:offset + size].decode('utf-8')
+        return SimpleText(text, parent), offset + size
+    selection = TextSelection(u'', parent)
+    selected, = UINT.unpack_from(data, offset)
+    count, = UINT.unpack_from(data, offset + UINT.size)
+    offset += 2 * UINT.size
+    alternatives = []
+    for index in xrange(count):
+        size, = UINT.unpack_from(data, offset)
+        offset += UINT.size
+        segments, end = read_segments(data, offset, selection)
+        alternatives.append(segments)
+        offset += size
+    selection.text = alternatives
+    selection.selection = selected
+    return selection, offset
+
+def count_selections(segments):
+    """number of TextSelections in the loaded, selected segments"""
+    count = 0
+    for segment, length in segments:
+        if isinstance(segment, TextSelection):
+            selected = segment.text[segment.selection]
+            count += 1 + count_selections(selected)
+    return count
+
+def write_segments(chunks, segments):
+    """append the encoded segments to chunks"""
+    chunks.append(UINT.pack(len(segments)))
+    for segment, length in segments:
+        if isinstance(segment, TextSelection):
+            write_selection(chunks, segment)
+        else:
+            text = segment.get_text().encode('utf-8')
+            chunks.extend([SIMPLE, UINT.pack(len(text)), text])
+
+def write_selection(chunks, selection):
+    """append an encoded TextSelection to chunks"""
+    chunks.extend([
+        SELECTION,
+        UINT.pack(selection.selection),
+        UINT.pack(len(selection.text)),
+    ])
+    for alternative in selection.text:
+        alternative_chunks = []
+        write_segments(alternative_chunks, alternative)
+        encoded = ''.join(alternative_chunks)
+        chunks.extend([UINT.pack(len(encoded)), encoded])
+
+def encode(text):
+    """the revision tree `text` as it is written to its file"""
+    document = text.get_text()
+    chunks = [HEADER.pack(MAGIC, VERSION, len(document), checksum(document))]
+    write_segments(chunks, text.text)
+    return ''.join(chunks)
+
+def save(filename, text):
+    """write the revision tree `text` to filename"""
+    atomic_write(filename, encode(text))
+
+def load(filename, document):
+    """load the revision tree belonging to document from filename
+
+    returns None if there is none, or if it belongs to another version
+    of the document. Pass None as document to skip that check."""
+    if not os.path.isfile(filename) or not os.path.getsize(filename):
+        return None
+    revision_file = open(filename, 'rb')
+    try:
+        data = revision_file.read()
+    finally:
+        revision_file.close()
+    if len(data) < HEADER.size:
+        return None
+    magic, version, length, crc = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        return None
+    if document is not None and \
+       (length != len(document) or crc != checksum(document)):
+        return None
+    text = Text(u'', 0)
+    text.text, offset = read_segments(data, HEADER.size, text)
+    text.revisions = count_selections(text.text)
+    return text
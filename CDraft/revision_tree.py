@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# CDraft, a fork of PyRoom.
+# Copyright (c) 2007 Nicolas P. Rougier & NoWhereMan
+# Copyright (c) 2008 The Pyroom Team - See AUTHORS file for more information
+# Copyright (c) 2011 Matthew Bunday
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+"""
+the revision tree behind every buffer
+
+A Text is a sequence of segments: plain SimpleText or TextSelections,
+which hold alternative revisions of the same piece of text.
+"""
+
+from offset_tree import OffsetTree
+from piece_table import PieceTable, to_unicode
+
+class TextSelection(object):
+    """alternative revisions of a piece of text
+
+    segments only store their lengths, offsets passed to get_current are
+    relative to the selection and absolute positions are computed on
+    demand through start_pos. The joined text is cached and dropped
+    along the path of every edit."""
+    __slots__ = ('current', 'selection', 'parent', 'cached_text', 'text',
+                 'terminal')
+
+    def __init__(self, text="", parent = None):
+        self.current = 0
+        self.selection = 0
+        self.parent = parent
+        self.cached_text = None
+        first = SimpleText(text, self)
+        self.text = [OffsetTree([(first, len(first))])]
+        self.terminal = ""
+
+    def __len__(self):
+        return self.text[self.selection].length
+
+    @property
+    def start_pos(self):
+        return self.parent.child_start()
+
+    def child_start(self):
+        """absolute offset of the current segment"""
+        return self.start_pos + self.text[self.selection].start_of(self.current)
+
+    def get_text(self):
+        if self.cached_text is None:
+            self.cached_text = u''.join([
+                subtext.get_text()
+                for subtext, length in self.text[self.selection]
+            ])
+        return self.cached_text
+
+    def get_current(self, offset, after=False):
+        self.current, start, current, length = \
+                self.text[self.selection].find(offset, after)
+        return current.get_current(offset - start, after)
+
+    def resize(self, length):
+        self.cached_text = None
+        segments = self.text[self.selection]
+        segments.set_length(self.current,
+                            segments.length_of(self.current) + length)
+        self.parent.resize(length)
+
+    def insert_after_current(self, new_segments):
+        self.cached_text = None
+        segments = self.text[self.selection]
+        segments.set_length(self.current, len(segments[self.current]))
+        for i, segment in enumerate(new_segments):
+            segments.insert(self.current + i + 1, segment, len(segment))
+
+    def insert_text(self, inserted_text, insert_position):
+        self.text[self.selection][self.current].insert_text(inserted_text, insert_position)
+
+    def delete_text(self, start_offset, end_offset):
+        self.text[self.selection][self.current].delete_text(start_offset, end_offset)
+
+
+class SimpleText(object):
+    """a piece of text without alternatives
+
+    the text is kept as a plain string until it is edited for the first
+    time, most segments never are"""
+    __slots__ = ('content', 'parent')
+
+    def __init__(self, text="", parent = None):
+        self.content = to_unicode(text)
+        self.parent = parent
+
+    def __len__(self):
+        return len(self.content)
+
+    @property
+    def start_pos(self):
+        return self.parent.child_start()
+
+    @property
+    def pieces(self):
+        """the editable piece table of this segment"""
+        if not isinstance(self.content, PieceTable):
+            self.content = PieceTable(self.content)
+        return self.content
+
+    def get_text(self):
+        if isinstance(self.content, PieceTable):
+            return self.content.get_text()
+        return self.content
+
+    def get_current(self, offset, after=False):
+        return self
+
+    def insert_text(self, inserted_text, insert_position):
+        self.pieces.insert(insert_position - self.start_pos, inserted_text)
+        self.parent.resize(len(inserted_text))
+
+    def delete_text(self, start_offset, end_offset):
+        start_pos = self.start_pos
+        self.pieces.delete(start_offset - start_pos, end_offset - start_pos)
+        self.parent.resize(start_offset - end_offset)
+
+    def split(self, start_offset, end_offset):
+        """move the text between the offsets into a new TextSelection"""
+        start_pos = self.start_pos
+        start_offset -= start_pos
+        end_offset = min(end_offset - start_pos, len(self))
+        text = self.get_text()
+        new_segments = [
+            TextSelection(text[start_offset:end_offset], self.parent)
+        ]
+        if end_offset < len(text):
+            new_segments.append(SimpleText(text[end_offset:], self.parent))
+        self.content = text[:start_offset]
+        self.parent.insert_after_current(new_segments)
+
+
+class Text(object):
+    __slots__ = ('current', 'bookmark_start', 'cached_text', 'text',
+                 'revisions')
+
+    def __init__(self, text="", bookmark_start = 0):
+        self.current = 0
+        self.bookmark_start = bookmark_start
+        self.cached_text = None
+        # number of revised words in the current version of the text
+        self.revisions = 0
+        self.text = OffsetTree()
+        self.push(SimpleText(text, self))
+
+    def __len__(self):
+        return self.text.length
+
+    def child_start(self):
+        """absolute offset of the current segment"""
+        return self.bookmark_start + self.text.start_of(self.current)
+
+    def get_text(self):
+        if self.cached_text is None:
+            self.cached_text = u''.join([
+                subtext.get_text() for subtext, length in self.text
+            ])
+        return self.cached_text
+
+    def push(self, text):
+        self.cached_text = None
+        self.text.insert(len(self.text), text, len(text))
+
+    def get_current(self, offset, after=False):
+        """get the innermost segment at the absolute offset"""
+        self.current, start, current, length = \
+                self.text.find(offset - self.bookmark_start, after)
+        return current.get_current(offset - self.bookmark_start - start,
+                                   after)
+
+    def insert_text(self, inserted_text, insert_position):
+        self.get_current(insert_position).insert_text(inserted_text,
+                                                      insert_position)
+
+    def delete_text(self, start_offset, end_offset):
+        # the range may span several segments
+        while end_offset > start_offset:
+            current = self.get_current(start_offset, after=True)
+            current_end = min(end_offset, current.start_pos + len(current))
+            current.delete_text(start_offset, current_end)
+            end_offset -= current_end - start_offset
+
+    def revise(self, start_offset, end_offset):
+        """turn the text between the offsets into a new TextSelection"""
+        self.get_current(start_offset, after=True).split(start_offset,
+                                                         end_offset)
+        self.revisions += 1
+
+    def resize(self, length):
+        self.cached_text = None
+        self.text.set_length(self.current,
+                             self.text.length_of(self.current) + length)
+
+    def insert_after_current(self, new_segments):
+        self.cached_text = None
+        self.text.set_length(self.current, len(self.text[self.current]))
+        for i, segment in enumerate(new_segments):
+            self.text.insert(self.current + i + 1, segment, len(segment))
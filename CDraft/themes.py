@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# CDraft, a fork of PyRoom.
+# Copyright (c) 2007 Nicolas P. Rougier & NoWhereMan
+# Copyright (c) 2008 The Pyroom Team - See AUTHORS file for more information
+# Copyright (c) 2011 Matthew Bunday
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+
+"""
+theme files, found once and parsed once
+
+The theme directories are scanned into an index of theme names, which
+is only rebuilt when one of the directories changes. Every .theme file
+is parsed the first time it is used and only parsed again once its
+modification time changes.
+"""
+
+import ConfigParser
+import os
+
+from globals import state
+
+# themes from older versions miss some settings, they come from this one
+DEFAULT_THEME = 'green'
+
+class ThemeRegistry(object):
+    """settings of the theme files, by filename"""
+
+    def __init__(self):
+        # filename: (modification time, settings)
+        self.parsed = {}
+
+    def load(self, filename):
+        """settings of the theme file filename, don't change them"""
+        mtime = os.stat(filename).st_mtime
+        cached = self.parsed.get(filename)
+        if cached is None or cached[0] != mtime:
+            theme_file = ConfigParser.SafeConfigParser()
+            theme_file.read(filename)
+            cached = (mtime, dict(theme_file.items('theme')))
+            self.parsed[filename] = cached
+        return cached[1]
+
+registry = ThemeRegistry()
+
+def theme_directories():
+    """directories holding themes, the first one holding a theme wins
+
+    personal themes come first, then installed ones and the ones in the
+    source tree, in case CDraft is run without installation"""
+    directories = []
+    for directory in (
+        state['themes_dir'],
+        state['global_themes_dir'],
+        os.path.join(state['absolute_path'], '..', 'themes'),
+    ):
+        directory = os.path.normpath(directory)
+        if directory and directory not in directories:
+            directories.append(directory)
+    return directories
+
+def modification_time(directory):
+    try:
+        return os.stat(directory).st_mtime
+    except OSError:
+        return None
+
+class ThemeIndex(object):
+    """theme names and the files they are in"""
+
+    def __init__(self):
+        self.directories = None
+        self.mtimes = None
+        # name: filename, and the names in the order they were found
+        self.filenames = {}
+        self.names = []
+
+    def refresh(self):
+        """scan the directories again if one of them changed"""
+        if self.directories is None:
+            self.directories = theme_directories()
+        mtimes = [modification_time(d) for d in self.directories]
+        if mtimes == self.mtimes:
+            return
+        self.mtimes = mtimes
+        self.filenames = {}
+        self.names = []
+        for directory in self.directories:
+            if not os.path.isdir(directory):
+                continue
+            for filename in sorted(os.listdir(directory)):
+                if not filename.endswith('.theme'):
+                    continue
+                name = filename[:-len('.theme')]
+                if name not in self.filenames:
+                    self.filenames[name] = os.path.join(directory, filename)
+                    self.names.append(name)
+
+    def lookup(self, theme_name):
+        """filename of the theme, None if there is no such theme"""
+        self.refresh()
+        return self.filenames.get(theme_name)
+
+    def theme_names(self):
+        """names of all themes but the custom one"""
+        self.refresh()
+        return [name for name in self.names if name != 'custom']
+
+index = ThemeIndex()
@@ -43,6 +43,8 @@ DEFAULT_CONF = {
         'session':'True',
         'autosavetime':'2',
         'autosave':'0',
+        'undobudget':'4194304',
+        'readonlysize':'67108864',
     },
 }
 
@@ -74,6 +76,65 @@ class FailsafeConfigParser(SafeConfigParser):
             self.add_section(section)
             return self.get(section, option)
 
+# settings which are not strings
+SETTING_TYPES = {
+    ('visual', 'showborder'): int,
+    ('visual', 'showpath'): int,
+    ('visual', 'linespacing'): int,
+    ('visual', 'indent'): int,
+    ('editor', 'autosavetime'): int,
+    ('editor', 'autosave'): int,
+    ('editor', 'undobudget'): int,
+    ('editor', 'readonlysize'): int,
+}
+
+class SettingsSection(object):
+    """the settings of one section, as plain attributes"""
+
+class Settings(object):
+    """
+    typed settings, parsed once from a FailsafeConfigParser
+
+    Every setting of DEFAULT_CONF is an attribute of its section, e.g.
+    settings.editor.autosavetime, already converted and with defaults
+    filled in, so reading one costs an attribute lookup. Settings are
+    changed through set(), which keeps the parser up to date for
+    writing the conf file and tells the subscribers of the setting.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.subscribers = {}
+        for section, options in DEFAULT_CONF.items():
+            values = SettingsSection()
+            for option in options:
+                setattr(values, option, self.parse(section, option))
+            setattr(self, section, values)
+
+    def parse(self, section, option):
+        """the value of a setting in the parser, or its default if broken"""
+        convert = SETTING_TYPES.get((section, option), str)
+        try:
+            return convert(self.config.get(section, option))
+        except ValueError:
+            return convert(DEFAULT_CONF[section][option])
+
+    def set(self, section, option, value):
+        """change a setting, subscribers are called if its value changed"""
+        if not self.config.has_section(section):
+            self.config.add_section(section)
+        self.config.set(section, option, str(value))
+        value = self.parse(section, option)
+        values = getattr(self, section)
+        if getattr(values, option) == value:
+            return
+        setattr(values, option, value)
+        for callback in self.subscribers.get((section, option), []):
+            callback(value)
+
+    def subscribe(self, section, option, callback):
+        """call callback with the new value whenever a setting changes"""
+        self.subscribers.setdefault((section, option), []).append(callback)
+
 # yes imports that are not quite obvious suck but we need to avoid
 # circular imports here
 from globals import state
@@ -102,18 +163,44 @@ def build_default_conf():
 
 def get_themes_list():
     """get all the theme files sans file suffix and the custom theme"""
-    themeslist = []
-    rawthemeslist = os.listdir(state['themes_dir'])
-    globalthemeslist = os.listdir(state['global_themes_dir'])
-    for themefile in rawthemeslist:
-        if themefile.endswith('theme') and themefile != 'custom.theme':
-            themeslist.append(themefile[:-6])
-    for themefile in globalthemeslist:
-        if themefile.endswith('theme') and themefile != 'custom.theme':
-            # TODO : do not add in the themelist a theme already existing in
-            # the personal directory
-            if not themefile[:-6] in themeslist:
-                themeslist.append(themefile[:-6])
-    return themeslist
+    # themes needs globals, which imports this module
+    from themes import index
+    return index.theme_names()
+
 
+# bytes handed to a single write call
+WRITE_CHUNK = 1024 * 1024
 
+def atomic_write(filename, data):
+    """replace filename by a file holding data
+
+    data is written in chunks to a temporary file which is synced and
+    renamed over filename, so readers and crashes see either the old or
+    the new content. Symlinks are followed and the mode of the old file
+    is kept."""
+    filename = os.path.realpath(filename)
+    temp_filename = os.path.join(
+        os.path.dirname(filename),
+        '.%s.tmp' % os.path.basename(filename)
+    )
+    temp_file = open(temp_filename, 'wb')
+    renamed = False
+    try:
+        try:
+            for start in xrange(0, len(data), WRITE_CHUNK):
+                temp_file.write(buffer(data, start, WRITE_CHUNK))
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        finally:
+            temp_file.close()
+        if os.path.exists(filename):
+            os.chmod(temp_filename, os.stat(filename).st_mode & 07777)
+        os.rename(temp_filename, filename)
+        renamed = True
+    finally:
+        if not renamed:
+            # don't leave a half written file behind
+            try:
+                os.remove(temp_filename)
+            except OSError:
+                pass
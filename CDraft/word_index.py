@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# CDraft, a fork of PyRoom.
+# Copyright (c) 2007 Nicolas P. Rougier & NoWhereMan
+# Copyright (c) 2008 The Pyroom Team - See AUTHORS file for more information
+# Copyright (c) 2011 Matthew Bunday
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+
+"""
+word boundaries of a text, kept up to date on every edit
+
+The text is described as runs of word characters (what re.UNICODE calls
+\\w), apostrophes and other separators (whitespace, tabs, newlines and
+punctuation). Runs are stored as signed lengths in small arrays held in
+an OffsetTree, so finding the run under an offset is O(log n) and an
+edit only rewrites one block. A single apostrophe between two word runs
+joins them, as in "don't", so a word is \\w+(?:'\\w+)*.
+
+>>> WordIndex(u"don't stop, 'tis the dogs' bone").word_count
+6
+>>> WordIndex(u"don't stop").word_at(2)
+(0, 5)
+"""
+
+from array import array
+from itertools import islice
+import re
+
+from offset_tree import OffsetTree
+
+APOSTROPHES = u"'’"
+TOKEN = re.compile(u"(\\w+)|([%s]+)|[^\\w%s]+" % (APOSTROPHES, APOSTROPHES),
+                   re.UNICODE)
+
+# runs per block, blocks are split once they hold twice as many
+BLOCK_RUNS = 64
+
+WORD_RUN, SEPARATOR_RUN, APOSTROPHE_RUN = range(3)
+
+def make_run(kind, length):
+    """encode a run
+
+    words are positive lengths, separators negative ones, shifted left
+    by one with the lowest bit set for apostrophes"""
+    if kind == WORD_RUN:
+        return length
+    return -(length << 1 | (kind == APOSTROPHE_RUN))
+
+def run_kind(run):
+    if run > 0:
+        return WORD_RUN
+    if -run & 1:
+        return APOSTROPHE_RUN
+    return SEPARATOR_RUN
+
+def run_length(run):
+    if run > 0:
+        return run
+    return -run >> 1
+
+# an apostrophe that joins the words around it
+JOINER = make_run(APOSTROPHE_RUN, 1)
+
+def tokenize(text):
+    """yield the runs of text"""
+    for match in TOKEN.finditer(text):
+        length = match.end() - match.start()
+        if match.lastindex == 1:
+            yield make_run(WORD_RUN, length)
+        elif match.lastindex == 2:
+            yield make_run(APOSTROPHE_RUN, length)
+        else:
+            yield make_run(SEPARATOR_RUN, length)
+
+def coalesce(runs):
+    """join neighbouring runs of the same kind, drop empty ones"""
+    current = None
+    for run in runs:
+        if not run_length(run):
+            continue
+        if current is not None and run_kind(current) == run_kind(run):
+            current = make_run(run_kind(run),
+                               run_length(current) + run_length(run))
+        else:
+            if current is not None:
+                yield current
+            current = run
+    if current is not None:
+        yield current
+
+def splice(runs, offset, new_runs):
+    """yield runs with new_runs inserted at offset"""
+    position = 0
+    inserted = False
+    for run in runs:
+        length = run_length(run)
+        if not inserted and position <= offset <= position + length:
+            kind = run_kind(run)
+            yield make_run(kind, offset - position)
+            for new_run in new_runs:
+                yield new_run
+            yield make_run(kind, position + length - offset)
+            inserted = True
+        else:
+            yield run
+        position += length
+
+def cut(runs, start_offset, end_offset):
+    """yield runs without the part between the offsets"""
+    position = 0
+    for run in runs:
+        length = run_length(run)
+        kept = max(0, min(start_offset, position + length) - position) + \
+               max(0, position + length - max(end_offset, position))
+        yield make_run(run_kind(run), min(kept, length))
+        position += length
+
+class WordIndex(object):
+    """word and separator runs of a text, and the number of words"""
+    __slots__ = ('blocks', 'word_count')
+
+    def __init__(self, text=u''):
+        self.blocks = OffsetTree()
+        self.word_count = 0
+        self.insert(0, text)
+
+    def __len__(self):
+        return self.blocks.length
+
+    def _count_words(self, first, last):
+        """words in the blocks first to last
+
+        a word belongs to the block it starts in, so it is counted once
+        when it goes on across blocks or apostrophes"""
+        first, last = max(first, 0), min(last, len(self.blocks) - 1)
+        count = 0
+        for index in xrange(first, last + 1):
+            # the neighbouring runs, 0 at the ends of the text
+            previous = self.blocks[index - 1][-1] if index > 0 else 0
+            following = 0
+            if index + 1 < len(self.blocks):
+                following = self.blocks[index + 1][0]
+            runs = [previous] + list(self.blocks[index]) + [following]
+            for i in xrange(1, len(runs) - 1):
+                run = runs[i]
+                if run > 0 and runs[i - 1] <= 0:
+                    count += 1
+                elif run == JOINER and runs[i - 1] > 0 and runs[i + 1] > 0:
+                    count -= 1
+        return count
+
+    def _store(self, index, count, runs):
+        """replace count blocks at index by blocks holding runs"""
+        # recount the touched blocks and their neighbours
+        self.word_count -= self._count_words(index - 1, index + count)
+        for i in xrange(count):
+            self.blocks.pop(index)
+        first = index
+        runs = iter(runs)
+        chunk = list(islice(runs, 2 * BLOCK_RUNS + 1))
+        if len(chunk) > 2 * BLOCK_RUNS:
+            chunk, runs = chunk[:BLOCK_RUNS], \
+                    iter(chunk[BLOCK_RUNS:] + list(runs))
+        while chunk:
+            block = array('l', chunk)
+            self.blocks.insert(index, block,
+                               sum([run_length(run) for run in block]))
+            index += 1
+            chunk = list(islice(runs, BLOCK_RUNS))
+        self.word_count += self._count_words(first - 1, index)
+
+    def insert(self, offset, text):
+        """text has been inserted at offset"""
+        if not text:
+            return
+        if not len(self.blocks):
+            self._store(0, 0, coalesce(tokenize(text)))
+            return
+        index, start, runs, length = self.blocks.find(offset)
+        self._store(index, 1,
+                    coalesce(splice(runs, offset - start, tokenize(text))))
+
+    def delete(self, start_offset, end_offset):
+        """the text between the offsets has been deleted"""
+        end_offset = min(end_offset, len(self))
+        while end_offset > start_offset:
+            index, start, runs, length = \
+                    self.blocks.find(start_offset, after=True)
+            cut_from = start_offset - start
+            cut_to = min(end_offset - start, length)
+            self._store(index, 1, coalesce(cut(runs, cut_from, cut_to)))
+            end_offset -= cut_to - cut_from
+
+    def _step(self, place, step):
+        """(block, run) next to the run at place, None at the ends"""
+        index, i = place
+        i += step
+        if 0 <= i < len(self.blocks[index]):
+            return index, i
+        index += step
+        if not 0 <= index < len(self.blocks):
+            return None
+        return index, (0 if step > 0 else len(self.blocks[index]) - 1)
+
+    def _run(self, place):
+        if place is None:
+            return 0
+        index, i = place
+        return self.blocks[index][i]
+
+    def _in_word(self, place):
+        """whether the run at place is part of a word"""
+        run = self._run(place)
+        if run > 0:
+            return True
+        return run == JOINER and self._run(self._step(place, -1)) > 0 and \
+               self._run(self._step(place, 1)) > 0
+
+    def run_at(self, offset):
+        """(is_word, start, end) of the word or the stretch between words
+        holding the character at offset"""
+        index, position, runs, length = self.blocks.find(offset, after=True)
+        for i, run in enumerate(runs):
+            if position + run_length(run) > offset:
+                break
+            position += run_length(run)
+        place = index, i
+        is_word = self._in_word(place)
+        start, end = position, position + run_length(run)
+        # it may go on across runs and blocks
+        previous = self._step(place, -1)
+        while previous is not None and self._in_word(previous) == is_word:
+            start -= run_length(self._run(previous))
+            previous = self._step(previous, -1)
+        following = self._step(place, 1)
+        while following is not None and self._in_word(following) == is_word:
+            end += run_length(self._run(following))
+            following = self._step(following, 1)
+        return is_word, start, end
+
+    def word_at(self, offset):
+        """range to revise at offset
+
+        that is the word under offset or, between words, the previous
+        word up to offset"""
+        if offset < len(self):
+            is_word, start, end = self.run_at(offset)
+            if is_word:
+                return start, end
+        if offset == 0:
+            return 0, 0
+        is_word, start, end = self.run_at(offset - 1)
+        if not is_word and start > 0:
+            is_word, start, end = self.run_at(start - 1)
+        return start, offset
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# CDraft, a fork of PyRoom.
+# Copyright (c) 2007 Nicolas P. Rougier & NoWhereMan
+# Copyright (c) 2008 The Pyroom Team - See AUTHORS file for more information
+# Copyright (c) 2011 Matthew Bunday
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+
+"""
+write files in a worker thread
+
+Saving and autosaving hand a snapshot of the text to the writer thread,
+which runs the queued jobs one after the other, so writes to the same
+file never overlap and a slow disk doesn't stall typing.
+"""
+
+import Queue
+import sys
+import threading
+
+import gobject
+
+jobs = Queue.Queue()
+worker = None
+
+def run_jobs():
+    """worker thread, runs queued jobs"""
+    while True:
+        job, args = jobs.get()
+        try:
+            job(*args)
+        except Exception:
+            # the thread has to survive for the jobs queued after this
+            # one, the error is reported from the main loop
+            gobject.idle_add(reraise, sys.exc_info())
+        finally:
+            jobs.task_done()
+
+def reraise(error):
+    """raise the error of a job, runs in the main loop"""
+    raise error[0], error[1], error[2]
+
+def queue_job(job, *args):
+    """run job in the worker thread"""
+    global worker
+    if worker is None:
+        worker = threading.Thread(target=run_jobs, name='writer')
+        worker.setDaemon(True)
+        worker.start()
+    jobs.put((job, args))
+
+def wait():
+    """wait until all queued jobs are done"""
+    jobs.join()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+memory used by the read-only viewer for growing file sizes
+
+the mapped pages belong to the page cache, so only anonymous memory is
+counted. Run from the source tree: python benchmarks/mapped_file.py
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'CDraft'))
+from mapped_file import MappedFile
+
+SIZES = [16, 64, 256]
+LINE = 'a line of some text, long enough to look like prose. ' * 2 + '\n'
+WINDOW_LINES = 2000
+
+def anonymous():
+    """anonymous resident memory in bytes"""
+    status = open('/proc/self/status')
+    try:
+        for line in status:
+            if line.startswith('RssAnon:'):
+                return int(line.split()[1]) * 1024
+    finally:
+        status.close()
+
+def make_file(megabytes):
+    handle, filename = tempfile.mkstemp()
+    block = LINE * (1024 * 1024 / len(LINE))
+    for i in xrange(megabytes):
+        os.write(handle, block)
+    os.close(handle)
+    return filename
+
+def main():
+    # the first run pays for one time allocations, leave it out
+    for megabytes in [1] + SIZES:
+        filename = make_file(megabytes)
+        try:
+            before = anonymous()
+            mapped = MappedFile(filename)
+            mapped.indexer.join()
+            lines = mapped.block_lines[-1]
+            for first in (0, lines / 2, lines - WINDOW_LINES):
+                window = mapped.lines(first, WINDOW_LINES)
+            used = anonymous() - before
+            if megabytes in SIZES:
+                print '%4d MB, %8d lines: %6d KB' % (megabytes, lines,
+                                                     used / 1024)
+            del window
+            mapped.close()
+        finally:
+            os.remove(filename)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+memory used per revision tree node
+
+run from the source tree: python benchmarks/memory.py
+"""
+
+import gc
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'CDraft'))
+from revision_tree import Text
+
+NODES = 200000
+
+def resident():
+    """resident set size in bytes"""
+    statm = open('/proc/self/statm')
+    try:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    finally:
+        statm.close()
+
+def main():
+    word = u'word '
+    gc.collect()
+    before = resident()
+    text = Text(word * NODES, 0)
+    # every revision turns a word into a TextSelection and its own
+    # SimpleText, followed by a SimpleText with the rest of the document
+    for offset in xrange(len(text) - len(word), 0, -len(word) * 2):
+        text.revise(offset, offset + len(word))
+    gc.collect()
+    nodes = len(text.text)
+    used = resident() - before
+    print '%d segments, %d bytes per segment' % (nodes, used / nodes)
+
+if __name__ == '__main__':
+    main()
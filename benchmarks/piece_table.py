@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+per keystroke latency of the piece table for growing document sizes
+
+run from the source tree: python benchmarks/piece_table.py
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'CDraft'))
+from piece_table import PieceTable
+
+SIZES = (10 * 1024, 1024 * 1024, 10 * 1024 * 1024)
+KEYSTROKES = 5000
+
+def keystrokes(size):
+    """type, jump around and delete in a document of `size` characters"""
+    table = PieceTable(u'lorem ipsum ' * (size / 12))
+    random.seed(size)
+    cursor = len(table) / 2
+    started = time.time()
+    for stroke in xrange(KEYSTROKES):
+        if stroke % 50 == 0:
+            cursor = random.randint(0, len(table))
+        if stroke % 7 == 0 and cursor > 0:
+            table.delete(cursor - 1, cursor)
+            cursor -= 1
+        else:
+            table.insert(cursor, u'x')
+            cursor += 1
+    return (time.time() - started) / KEYSTROKES
+
+def main():
+    for size in SIZES:
+        print '%8d KB: %6.2f us per keystroke' % (
+            size / 1024, keystrokes(size) * 1000000)
+
+if __name__ == '__main__':
+    main()
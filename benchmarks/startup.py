@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+time from starting cdraft until it is ready for the first keystroke
+
+needs pygtk and a display, the target is below 150 ms. Run from the
+source tree: python benchmarks/startup.py [file...]
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+CDRAFT = os.path.join(os.path.dirname(__file__), '..', 'cdraft')
+RUNS = 10
+
+def startup(files):
+    """seconds until cdraft reports it is ready, and its own measure"""
+    started = time.time()
+    process = subprocess.Popen(
+        [sys.executable, CDRAFT, '--instrument'] + files,
+        stderr=subprocess.PIPE,
+    )
+    try:
+        for line in iter(process.stderr.readline, ''):
+            if 'ready for input after' in line:
+                return time.time() - started, line.split()[-2]
+    finally:
+        process.terminate()
+        process.wait()
+    raise RuntimeError('cdraft exited before it was ready')
+
+def main():
+    times = []
+    for i in xrange(RUNS):
+        wall, own = startup(sys.argv[1:])
+        times.append(wall)
+        print '%6.1f ms (%s ms after import)' % (wall * 1000, own)
+    times.sort()
+    print 'median %.1f ms' % (times[len(times) / 2] * 1000)
+
+if __name__ == '__main__':
+    main()